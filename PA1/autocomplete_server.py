@@ -0,0 +1,298 @@
+# CS122: Auto-completing keyboard using Tries
+# Autocompletion as a local service
+#
+# Antony Awad
+#
+# Usage: python3 autocomplete_server.py DICTIONARY (--unix PATH | --port N)
+#
+# Loads one EnglishDictionary (from a word file or a snapshot) and answers
+# requests from any number of clients over a Unix or TCP socket. The
+# protocol is line-delimited JSON: every request is one JSON object on a
+# line and gets exactly one JSON object back on a line, in the order the
+# requests were sent, so a client may pipeline as many requests as it
+# likes without waiting for the answers. Requests carry an "op" and may
+# carry an "id", which is echoed back:
+#
+#   {"op": "is_word", "word": "an"}          -> {"result": true}
+#   {"op": "num_completions", "prefix": "a"} -> {"result": 4}
+#   {"op": "complete", "prefix": "a", "k": 3}
+#                                            -> {"result": ["", "n", "nd"]}
+#   {"op": "fuzzy", "word": "anf", "max_edits": 1}
+#                                            -> {"result": ["and", "an"]}
+#
+# max_edits is capped at MAX_EDITS, and fuzzy searches run in a thread so
+# that a slow one does not hold up the other clients. Likewise k is capped
+# at MAX_COMPLETIONS (a k of null asks for that many), and a backspace
+# never removes more letters than the cursor's prefix has.
+#
+# Every connection also owns a cursor (see EnglishDictionary.cursor), for
+# editors that send one keystroke at a time:
+#
+#   {"op": "advance", "letters": "an"}, {"op": "backspace"},
+#   {"op": "reset"}                          -> the cursor's state:
+#       {"result": {"prefix": "an", "is_word": true, "num_completions": 2}}
+#   {"op": "cursor_complete", "k": 10}       -> {"result": [...]}
+#
+# {"op": "stats"} returns request counts and latency percentiles per op;
+# requests without a valid op are counted under "invalid". Errors are
+# reported as {"error": "..."} and do not close the connection, except for
+# a request line longer than MAX_LINE bytes, which is answered with an
+# error before the connection is closed.
+
+import argparse
+import asyncio
+from collections import deque
+import json
+import os
+import sys
+import time
+
+import autocorrect_shell
+import english_dictionary_compact
+
+# Latency samples kept per op for the stats request
+LATENCY_WINDOW = 10000
+
+# Largest edit distance a fuzzy request may ask for
+MAX_EDITS = 2
+
+# Most completions a complete or cursor_complete request may ask for
+MAX_COMPLETIONS = 1000
+
+# Longest request line accepted, in bytes
+MAX_LINE = 2 ** 16
+
+
+class LatencyStats(object):
+    def __init__(self):
+        '''
+        Constructor. Keeps a request count and a window of recent latencies
+        for every op.
+        '''
+        self._counts = {}
+        self._samples = {}
+
+    def record(self, op, seconds):
+        '''
+        Record how long a request took.
+
+        Inputs:
+            op (string): the request's op
+            seconds (float): time spent answering it
+        '''
+        self._counts[op] = self._counts.get(op, 0) + 1
+        if op not in self._samples:
+            self._samples[op] = deque(maxlen=LATENCY_WINDOW)
+        self._samples[op].append(seconds)
+
+    def summary(self):
+        '''
+        Returns: dict mapping each op to its count and latency
+            percentiles, in microseconds
+        '''
+        summary = {}
+        for op, samples in self._samples.items():
+            ordered = sorted(samples)
+            n = len(ordered)
+            summary[op] = {"count": self._counts[op],
+                           "p50_us": 1e6 * ordered[n // 2],
+                           "p99_us": 1e6 * ordered[min(n - 1, n * 99 // 100)],
+                           "max_us": 1e6 * ordered[-1]}
+        return summary
+
+
+class AutocompleteServer(object):
+    def __init__(self, eng_dict):
+        '''
+        Constructor
+
+        Inputs:
+            eng_dict: the EnglishDictionary shared by every client
+        '''
+        self.eng_dict = eng_dict
+        self.stats = LatencyStats()
+        self.clients = 0
+
+    async def handle_client(self, reader, writer):
+        '''
+        Serve one connection until the client closes it. Requests are read
+        and answered strictly in order, so pipelined requests get their
+        answers in the order they were sent.
+        '''
+        cursor = autocorrect_shell.make_cursor(self.eng_dict)
+        self.clients += 1
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    # The rest of the line may still be coming, so there
+                    # is no telling where the next request starts.
+                    writer.write(json.dumps(
+                        {"error": "request longer than %d bytes"
+                                  % MAX_LINE}).encode() + b"\n")
+                    await writer.drain()
+                    break
+                if not line:
+                    break
+                writer.write(await self.respond(line, cursor))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.clients -= 1
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def respond(self, line, cursor):
+        '''
+        Answer one request line. Handlers may be coroutines, for work that
+        is done off the event loop.
+
+        Inputs:
+            line (bytes): the request
+            cursor: the connection's cursor
+
+        Returns: bytes, the response line
+        '''
+        start = time.perf_counter()
+        op = "invalid"
+        response = {}
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+            if "id" in request:
+                response["id"] = request["id"]
+            handler = getattr(self, "op_" + str(request.get("op")), None)
+            if handler is None:
+                raise ValueError("unknown op %r" % request.get("op"))
+            op = request["op"]
+            result = handler(request, cursor)
+            if asyncio.iscoroutine(result):
+                result = await result
+            response["result"] = result
+        except (ValueError, KeyError, TypeError) as e:
+            response["error"] = str(e)
+        self.stats.record(op, time.perf_counter() - start)
+        return json.dumps(response).encode() + b"\n"
+
+    def op_is_word(self, request, cursor):
+        return self.eng_dict.is_word(request["word"])
+
+    def op_num_completions(self, request, cursor):
+        return self.eng_dict.num_completions(request["prefix"])
+
+    def op_complete(self, request, cursor):
+        return self.eng_dict.get_completions(request["prefix"],
+                                             self.completion_limit(request))
+
+    async def op_fuzzy(self, request, cursor):
+        word = request["word"]
+        max_edits = request.get("max_edits", 1)
+        if not isinstance(word, str) or not isinstance(max_edits, int):
+            raise TypeError("word must be a string and max_edits an int")
+        max_edits = max(0, min(max_edits, MAX_EDITS))
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, self.eng_dict.fuzzy_versions, word, max_edits)
+
+    def op_advance(self, request, cursor):
+        for letter in request["letters"]:
+            cursor.advance(letter)
+        return self.cursor_state(cursor)
+
+    def op_backspace(self, request, cursor):
+        n = request.get("n", 1)
+        if not isinstance(n, int):
+            raise TypeError("n must be an int")
+        for _ in range(max(0, min(n, len(cursor.prefix)))):
+            cursor.backspace()
+        return self.cursor_state(cursor)
+
+    def op_reset(self, request, cursor):
+        cursor.reset()
+        return self.cursor_state(cursor)
+
+    def op_cursor_complete(self, request, cursor):
+        return cursor.get_completions(self.completion_limit(request))
+
+    def op_stats(self, request, cursor):
+        return {"clients": self.clients, "ops": self.stats.summary()}
+
+    def completion_limit(self, request):
+        '''
+        Returns: int, the request's k (10 if it has none), capped at
+            MAX_COMPLETIONS
+        '''
+        k = request.get("k", 10)
+        if k is None:
+            return MAX_COMPLETIONS
+        if not isinstance(k, int):
+            raise TypeError("k must be an int")
+        return max(0, min(k, MAX_COMPLETIONS))
+
+    def cursor_state(self, cursor):
+        return {"prefix": cursor.prefix, "is_word": cursor.is_word(),
+                "num_completions": cursor.num_completions()}
+
+    async def serve(self, unix_path=None, host="127.0.0.1", port=None):
+        '''
+        Listen on a Unix socket (if unix_path is given) or on a TCP port
+        and serve clients until cancelled.
+
+        Inputs:
+            unix_path (string or None): path of the Unix socket
+            host (string): TCP address to bind
+            port (int or None): TCP port; 0 picks a free one
+        '''
+        server = await self.start(unix_path, host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def start(self, unix_path=None, host="127.0.0.1", port=None):
+        '''
+        Start listening without blocking, for callers (and tests) that run
+        their own event loop.
+
+        Returns: asyncio.Server
+        '''
+        if unix_path is not None:
+            if os.path.exists(unix_path):
+                os.unlink(unix_path)
+            return await asyncio.start_unix_server(self.handle_client,
+                                                   unix_path, limit=MAX_LINE)
+        return await asyncio.start_server(self.handle_client, host, port,
+                                          limit=MAX_LINE)
+
+
+def go():
+    '''
+    Process the arguments and run the server.
+    '''
+    parser = argparse.ArgumentParser(
+        description="Serve autocompletion over a socket.")
+    parser.add_argument("dictionary",
+                        help="word file or dictionary snapshot")
+    where = parser.add_mutually_exclusive_group(required=True)
+    where.add_argument("--unix", help="path of a Unix socket to listen on")
+    where.add_argument("--port", type=int, help="TCP port to listen on")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="TCP address to bind")
+    args = parser.parse_args()
+
+    server = AutocompleteServer(
+        english_dictionary_compact.open_dictionary(args.dictionary))
+    sys.stderr.write("serving %s\n" % (args.unix or
+                                       "%s:%d" % (args.host, args.port)))
+    try:
+        asyncio.run(server.serve(args.unix, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    go()
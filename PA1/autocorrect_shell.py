@@ -14,49 +14,105 @@
 ###                                  ###
 ########################################
 
+import codecs
 import os
+import selectors
 import sys
 import tty
 import termios
-import fcntl
 import string
 import importlib
 
 module = None
 
+# Seconds of quiet after a keystroke before the shell looks the word up;
+# keys typed sooner are applied first and the earlier lookup is dropped.
+# A word with a single completion is accepted at once, without waiting.
+DEBOUNCE = 0.05
+
 
 def load_trie_module(name):
     global module
     module = importlib.import_module(name)
 
 
-def getch():
+class RawTerminal(object):
     '''
-    Get a character from stdin
+    Keyboard input for the shell. The terminal is switched out of line
+    mode (and echo) once, when the context is entered, and restored when it
+    is left; in between, reads sleep in select() until a key arrives, so an
+    idle shell uses no CPU.
     '''
-    fd = sys.stdin.fileno()
 
-    oldterm = termios.tcgetattr(fd)
-    newattr = termios.tcgetattr(fd)
-    newattr[3] = newattr[3] & ~termios.ICANON & ~termios.ECHO
-    termios.tcsetattr(fd, termios.TCSANOW, newattr)
+    def __init__(self, f=None):
+        self._fd = (f or sys.stdin).fileno()
+        self._decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        self._selector = selectors.DefaultSelector()
+        self._oldterm = None
+
+    def __enter__(self):
+        if os.isatty(self._fd):
+            self._oldterm = termios.tcgetattr(self._fd)
+            newattr = termios.tcgetattr(self._fd)
+            newattr[tty.LFLAG] &= ~termios.ICANON & ~termios.ECHO
+            newattr[tty.CC][termios.VMIN] = 1
+            newattr[tty.CC][termios.VTIME] = 0
+            termios.tcsetattr(self._fd, termios.TCSANOW, newattr)
+        self._selector.register(self._fd, selectors.EVENT_READ)
+        return self
+
+    def __exit__(self, *exc):
+        self._selector.unregister(self._fd)
+        if self._oldterm is not None:
+            termios.tcsetattr(self._fd, termios.TCSAFLUSH, self._oldterm)
+            self._oldterm = None
+
+    def read(self, timeout=None):
+        '''
+        Wait for keys and return every key that has arrived.
+
+        Inputs:
+            timeout (float or None): seconds to wait; None waits forever
+
+        Returns: string of keys; "" if the timeout passed first
+
+        Raises EOFError at the end of the input.
+        '''
+        while True:
+            if not self._selector.select(timeout):
+                return ""
+            data = os.read(self._fd, 1024)
+            if not data:
+                raise EOFError
+            keys = self._decoder.decode(data)
+            if keys:
+                return keys
+
+    def read_char(self):
+        '''
+        Wait for one key, leaving any keys after it unread.
+
+        Returns: string of length 1
+
+        Raises EOFError at the end of the input.
+        '''
+        while True:
+            self._selector.select()
+            data = os.read(self._fd, 1)
+            if not data:
+                raise EOFError
+            c = self._decoder.decode(data)
+            if c:
+                return c
 
-    oldflags = fcntl.fcntl(fd, fcntl.F_GETFL)
-    fcntl.fcntl(fd, fcntl.F_SETFL, oldflags | os.O_NONBLOCK)
 
-    try:
-        while True:
-            try:
-                c = sys.stdin.read(1)
-                if c != "":
-                    break
-            except IOError:
-                pass
+def getch():
+    '''
+    Get a character from stdin
+    '''
+    with RawTerminal() as term:
+        return term.read_char()
 
-    finally:
-        termios.tcsetattr(fd, termios.TCSAFLUSH, oldterm)
-        fcntl.fcntl(fd, fcntl.F_SETFL, oldflags)
-    return c
 
 nearby_dict = {"q": ["w", "a"],
                "w": ["q", "e", "s"],
@@ -100,8 +156,14 @@ def did_you_mean(eng_dict, word):
     Return a list of possible correct words that are "near" to the
     current word.
     '''
-    fv = []  # trie.fuzzy_versions(t, word)
-    if len(fv) == 0:
+    if word == "" or not hasattr(eng_dict, "fuzzy_versions"):
+        return
+    # Widen the search only if nothing is one edit away.
+    for max_edits in (1, 2):
+        fv = eng_dict.fuzzy_versions(word, max_edits)
+        if len(fv) > 0:
+            break
+    else:
         return
     if len(fv) <= 20:
         print("Did you mean one of these?")
@@ -130,13 +192,57 @@ def prompt(message, word):
     sys.stdout.flush()
 
 
-def process_completions(eng_dict, message, word, print_candidates):
+class PrefixCursor(object):
+    '''
+    Stand-in for EnglishDictionary.cursor() for dictionaries that can only
+    be queried with a whole prefix; every query starts from scratch.
+    '''
+
+    def __init__(self, eng_dict):
+        self._dict = eng_dict
+        self.prefix = ""
+
+    def reset(self):
+        self.prefix = ""
+
+    def advance(self, letter):
+        self.prefix += letter
+
+    def backspace(self):
+        self.prefix = self.prefix[:-1]
+
+    def is_word(self):
+        return self._dict.is_word(self.prefix)
+
+    def num_completions(self):
+        return self._dict.num_completions(self.prefix)
+
+    def get_completions(self, k=None):
+        return self._dict.get_completions(self.prefix, k)
+
+    def iter_completions(self, limit=None):
+        return self._dict.iter_completions(self.prefix, limit)
+
+
+def make_cursor(eng_dict):
+    '''
+    Get a cursor for the dictionary, which keeps its place in the trie
+    between keystrokes when the backend supports it.
+    '''
+    if hasattr(eng_dict, "cursor"):
+        return eng_dict.cursor()
+    return PrefixCursor(eng_dict)
+
+
+def process_completions(eng_dict, cursor, message, word, print_candidates):
     '''
     Process the current "word" and generate a new message and prompt,
     information about possible completions, an error message, or
-    information about possible corrections to the word.
+    information about possible corrections to the word. The cursor must
+    be positioned at the end of word; it is reset when the word is
+    accepted.
     '''
-    n = eng_dict.num_completions(word)
+    n = cursor.num_completions()
     misspelled = False
 
     if n == 0:
@@ -148,20 +254,26 @@ def process_completions(eng_dict, message, word, print_candidates):
     elif n == 1:
         # If there is only one possible completion, go ahead and add
         # the word to the message.
-        word += eng_dict.get_completions(word)[0]
+        word += next(cursor.iter_completions(limit=1))
         if len(message) > 0:
             message += " "
         message += word
         word = ""
+        cursor.reset()
         print()
         prompt(message, word)
     else:
         if print_candidates:
             if n > 10:
                 print("\n(" + str(n) + " completions)")
+                if getattr(eng_dict, "ranked", False):
+                    # Show the most likely ones when the dictionary knows
+                    # word frequencies.
+                    for com in cursor.get_completions(10):
+                        print(word + com)
             else:
                 print()
-                for com in eng_dict.get_completions(word):
+                for com in cursor.iter_completions(limit=n):
                     print(word + com)
             prompt(message, word)
 
@@ -173,74 +285,108 @@ def shell(eng_dict):
     Gather characters from stdin and handle requests for auto
     completion, reset, etc.
 
+    The terminal is put in raw mode once for the whole session. Typing a
+    letter or Backspace only updates the cursor; the word is looked up
+    once no key has arrived for DEBOUNCE seconds, so a burst of typing
+    costs one lookup instead of one per key. Keys that need an up-to-date
+    answer (Space, Enter, Tab) run the pending lookup first. The count of
+    completions comes from the cursor without a lookup, so a word with a
+    single completion is still accepted on the key that made it unique,
+    and the keys typed after it start the next word.
+
     Type Control-C to get out of this shell.
     '''
     message = ""
     word = ""
     misspelled = False
+    pending = False
+    cursor = make_cursor(eng_dict)
     prompt(message, word)
-    while True:
-        # Get a character
-        c = getch()
-
-        # Control-D resets the message
-        if ord(c) == 4:
-            message = ""
-            word = ""
-            misspelled = False
-            print()
-            prompt(message, word)
-            continue
+    with RawTerminal() as term:
+        while True:
+            try:
+                keys = term.read(DEBOUNCE if pending else None)
+            except EOFError:
+                print()
+                return
+            if keys == "":
+                # Input went quiet: look up the word typed so far.
+                message, word, misspelled = process_completions(eng_dict, cursor, message, word, print_candidates=False)
+                pending = False
+                continue
 
-        # Possible end of word
-        if (c == " ") or (c == "\n"):
-            if misspelled:
-                misspelled_prompt(message, eng_dict, word)
-            else:
-                if not eng_dict.is_word(word):
-                    print("\nWord '%s' does not exist" % word)
-                    did_you_mean(eng_dict, word)
-                    prompt(message, word)
-                else:
-                    if len(message) > 0:
-                        message += " "
-                    message += word
+            for c in keys:
+                # Control-D resets the message
+                if ord(c) == 4:
+                    message = ""
                     word = ""
+                    misspelled = False
+                    pending = False
+                    cursor.reset()
                     print()
                     prompt(message, word)
-
-            continue
-
-        # Autocomplete
-        if c == "\t":
-            if word != "":
-                message, word, misspelled = process_completions(eng_dict, message, word, print_candidates=True)
-            continue
-
-        # Backspace
-        if ord(c) == 127:
-            if len(word) == 0:
-                print("cannot change previous word once accepted")
-                continue
-            word = word[:len(word) - 1]
-            sys.stdout.write('\r')
-            sys.stdout.flush()
-            prompt(message, word + " ")
-            sys.stdout.write('\b')
-            sys.stdout.flush()
-        else:
-            # If the character is not a letter, we're not interested
-            # in it.
-            if c not in string.ascii_letters:
-                message = "5:" + message
-                continue
-
-            # Update prompt and letter
-            sys.stdout.write(c)
-            sys.stdout.flush()
-            word = word + c
-
-        message, word, misspelled = process_completions(eng_dict, message, word, print_candidates=False)
+                    continue
+
+                if pending and c in " \n\t":
+                    message, word, misspelled = process_completions(eng_dict, cursor, message, word, print_candidates=False)
+                    pending = False
+
+                # Possible end of word
+                if (c == " ") or (c == "\n"):
+                    if misspelled:
+                        misspelled_prompt(message, eng_dict, word)
+                    else:
+                        if not cursor.is_word():
+                            print("\nWord '%s' does not exist" % word)
+                            did_you_mean(eng_dict, word)
+                            prompt(message, word)
+                        else:
+                            if len(message) > 0:
+                                message += " "
+                            message += word
+                            word = ""
+                            cursor.reset()
+                            print()
+                            prompt(message, word)
+
+                    continue
+
+                # Autocomplete
+                if c == "\t":
+                    if word != "":
+                        message, word, misspelled = process_completions(eng_dict, cursor, message, word, print_candidates=True)
+                    continue
+
+                # Backspace
+                if ord(c) == 127:
+                    if len(word) == 0:
+                        print("cannot change previous word once accepted")
+                        continue
+                    word = word[:len(word) - 1]
+                    cursor.backspace()
+                    sys.stdout.write('\r')
+                    sys.stdout.flush()
+                    prompt(message, word + " ")
+                    sys.stdout.write('\b')
+                    sys.stdout.flush()
+                else:
+                    # If the character is not a letter, we're not
+                    # interested in it.
+                    if c not in string.ascii_letters:
+                        message = "5:" + message
+                        continue
+
+                    # Update prompt and letter
+                    sys.stdout.write(c)
+                    sys.stdout.flush()
+                    word = word + c
+                    cursor.advance(c)
+
+                if cursor.num_completions() == 1:
+                    message, word, misspelled = process_completions(eng_dict, cursor, message, word, print_candidates=False)
+                    pending = False
+                else:
+                    pending = True
 
 
 def go(module_name=None):
@@ -254,19 +400,29 @@ def go(module_name=None):
     if module_name:
         module = __import__(module_name)
 
-    if(len(sys.argv) != 2):
-        print("Usage: python3 english_dictionary.py WORD_FILE")
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python3 english_dictionary.py WORD_FILE [SNAPSHOT]")
         exit(1)
 
     wordfile = sys.argv[1]
-
-    if not os.path.exists(wordfile):
-        print("Error: %s does not exist")
-        exit(1)
-
-    print("Loading words into trie...",)
-    eng_dict = module.EnglishDictionary(wordfile)
-    print(" done")
+    snapshot = sys.argv[2] if len(sys.argv) == 3 else None
+
+    if snapshot is not None and os.path.exists(snapshot):
+        # A snapshot saved by an earlier run is mapped in place instead of
+        # rebuilding the trie from the word file.
+        print("Loading trie snapshot...",)
+        eng_dict = module.EnglishDictionary.load(snapshot)
+        print(" done")
+    else:
+        if not os.path.exists(wordfile):
+            print("Error: %s does not exist" % wordfile)
+            exit(1)
+
+        print("Loading words into trie...",)
+        eng_dict = module.EnglishDictionary(wordfile)
+        print(" done")
+        if snapshot is not None:
+            eng_dict.save(snapshot)
     print("===================================================")
     print("      Welcome to the auto-completing shell!")
     print()
@@ -0,0 +1,211 @@
+# CS122: Auto-completing keyboard using Tries
+# Benchmark for the EnglishDictionary backends
+#
+# Antony Awad
+#
+# Usage: python3 benchmark.py [-b MODULE ...] [-w WORD_FILE ...] [-o OUT.json]
+#
+# Every backend module is measured on every word file in a fresh Python
+# process, so that build time and peak resident memory are not polluted by
+# earlier runs. For each run the harness records:
+#
+#   build_seconds           time to construct EnglishDictionary(word_file)
+#   baseline_rss_kb         resident set size before the build (the
+#                           interpreter and the backend module)
+#   peak_rss_kb             peak resident set size of the process once
+#                           the dictionary is built; the queries are drawn
+#                           only after it is recorded
+#   is_word_qps             is_word lookups per second (half hits, half
+#                           misses)
+#   num_completions_qps     num_completions lookups per second
+#   get_completions_ms      get_completions latency percentiles (ms),
+#                           keyed by prefix length
+#
+# The results are written as JSON so they can be compared across changes.
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+from english_dictionary import read_words
+
+BACKENDS = ["english_dictionary_list", "english_dictionary",
+            "english_dictionary_compact"]
+WORD_FILES = ["web2", "five"]
+PREFIX_LENGTHS = [1, 2, 3, 4, 5]
+PERCENTILES = [50, 90, 99]
+
+
+def sample_queries(wordfile, n, seed):
+    '''
+    Draw the query workload from a word file.
+
+    Input:
+        wordfile (str): name of the word file
+        n (int): number of queries of each kind
+        seed (int): random seed, so runs are comparable
+    Output:
+        words (list): words to look up, half of them misspelled
+        prefixes (dict): maps prefix length to a list of prefixes
+    '''
+    with open(wordfile) as f:
+        vocabulary = [w for w, _ in read_words(f)]
+    rng = random.Random(seed)
+    picks = [rng.choice(vocabulary) for _ in range(n)]
+    words = [w if i % 2 == 0 else w + "q" for i, w in enumerate(picks)]
+    prefixes = {length: [w[:length] for w in picks]
+                for length in PREFIX_LENGTHS}
+    return words, prefixes
+
+
+def percentiles(samples):
+    '''
+    Summarize latency samples, in milliseconds.
+
+    Input:
+        samples (list of float): latencies in seconds
+    Output:
+        dict
+    '''
+    samples = sorted(samples)
+    summary = {"p%d" % p: 1000 * samples[min(len(samples) - 1,
+                                             len(samples) * p // 100)]
+               for p in PERCENTILES}
+    summary["max"] = 1000 * samples[-1]
+    return summary
+
+
+def measure(module_name, wordfile, queries, seed):
+    '''
+    Build one backend on one word file and time the queries. Meant to run
+    in a process of its own.
+
+    Input:
+        module_name (str): backend module
+        wordfile (str): name of the word file
+        queries (int): number of queries of each kind
+        seed (int): random seed
+    Output:
+        dict of results
+    '''
+    module = __import__(module_name)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    eng_dict = module.EnglishDictionary(wordfile)
+    build = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Drawn after the peak is recorded, so that the vocabulary read here
+    # does not count against the backend.
+    words, prefixes = sample_queries(wordfile, queries, seed)
+
+    start = time.perf_counter()
+    for w in words:
+        eng_dict.is_word(w)
+    is_word_qps = len(words) / (time.perf_counter() - start)
+
+    all_prefixes = [p for length in PREFIX_LENGTHS for p in prefixes[length]]
+    start = time.perf_counter()
+    for p in all_prefixes:
+        eng_dict.num_completions(p)
+    num_completions_qps = len(all_prefixes) / (time.perf_counter() - start)
+
+    latencies = {}
+    for length in PREFIX_LENGTHS:
+        samples = []
+        for p in prefixes[length]:
+            start = time.perf_counter()
+            eng_dict.get_completions(p)
+            samples.append(time.perf_counter() - start)
+        latencies[str(length)] = percentiles(samples)
+
+    return {"backend": module_name, "word_file": wordfile,
+            "build_seconds": build, "baseline_rss_kb": baseline,
+            "peak_rss_kb": peak,
+            "is_word_qps": is_word_qps,
+            "num_completions_qps": num_completions_qps,
+            "get_completions_ms": latencies}
+
+
+def run(module_name, wordfile, queries, seed, timeout):
+    '''
+    Run measure() in a fresh interpreter.
+
+    Output:
+        dict of results, or of the error that stopped the run
+    '''
+    cmd = [sys.executable, os.path.abspath(__file__), "--worker",
+           module_name, wordfile, "--queries", str(queries),
+           "--seed", str(seed)]
+    try:
+        proc = subprocess.run(cmd, capture_output=True, text=True,
+                              timeout=timeout,
+                              cwd=os.path.dirname(os.path.abspath(__file__)))
+    except subprocess.TimeoutExpired:
+        return {"backend": module_name, "word_file": wordfile,
+                "error": "timed out after %ds" % timeout}
+    if proc.returncode != 0:
+        # A child killed by a signal (such as the OOM killer) may leave
+        # nothing on stderr.
+        lines = proc.stderr.strip().splitlines()
+        return {"backend": module_name, "word_file": wordfile,
+                "error": lines[-1] if lines
+                         else "exit status %d" % proc.returncode}
+    return json.loads(proc.stdout)
+
+
+def go():
+    '''
+    Process the arguments and run the benchmark.
+    '''
+    parser = argparse.ArgumentParser(
+        description="Benchmark the EnglishDictionary backends.")
+    parser.add_argument("-b", "--backends", nargs="+", default=BACKENDS,
+                        help="backend modules to measure")
+    parser.add_argument("-w", "--word-files", nargs="+", default=WORD_FILES,
+                        help="word files to load")
+    parser.add_argument("-q", "--queries", type=int, default=1000,
+                        help="number of queries of each kind")
+    parser.add_argument("-s", "--seed", type=int, default=122)
+    parser.add_argument("-t", "--timeout", type=int, default=600,
+                        help="seconds allowed per run")
+    parser.add_argument("-o", "--output", help="JSON file for the results")
+    parser.add_argument("--worker", nargs=2, metavar=("MODULE", "WORD_FILE"),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        module_name, wordfile = args.worker
+        print(json.dumps(measure(module_name, wordfile, args.queries,
+                                 args.seed)))
+        return
+
+    results = []
+    for wordfile in args.word_files:
+        if not os.path.exists(wordfile):
+            sys.stderr.write("skipping %s: no such file\n" % wordfile)
+            continue
+        wordfile = os.path.abspath(wordfile)
+        for module_name in args.backends:
+            sys.stderr.write("%s on %s...\n" % (module_name, wordfile))
+            results.append(run(module_name, wordfile, args.queries,
+                               args.seed, args.timeout))
+
+    report = json.dumps({"python": sys.version.split()[0],
+                         "queries": args.queries, "seed": args.seed,
+                         "results": results}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    go()
@@ -9,27 +9,65 @@
 #
 # Antony Awad, 21 January 2021
 
+from array import array
+from collections import deque
+from contextlib import contextmanager
+import gc
+import heapq
+from itertools import islice
 import os
+import re
 import sys
 from sys import exit
+import threading
 
 import autocorrect_shell
 
+# Number of ranked completions cached at every node that has more words
+# below it than this.
+TOP_K = 10
+
+# Cost of replacing a letter with one of its neighbours on the keyboard in
+# fuzzy_versions; every other edit costs 1.
+NEARBY_COST = 0.5
+
+# What counts as a word when spellchecking running text
+WORD_RE = re.compile(r"[A-Za-z]+")
+
+# Number of lines check_stream tokenizes and looks up at a time
+CHECK_BATCH = 10000
+
 
 class EnglishDictionary(object):
-    def __init__(self, wordfile):
+    def __init__(self, wordfile, substrings=False):
         '''
         Constructor
 
         Inputs:
-            wordfile (string): name of the file with the words.
+            wordfile (string): name of the file with the words. Each line
+                holds a word, optionally followed by its frequency.
+            substrings (boolean): build the substring index now instead of
+                on the first find_containing or count_containing
         '''
         self.words = TrieNode()
+        self.ranked = False
         with open(wordfile) as f:
-            for w in f:
-                w = w.strip()
-                if w != "" and not self.is_word(w):
-                    self.words.add_word(w)
+            self.words.add_words(self._note_frequencies(read_words(f)))
+        if self.ranked:
+            self.words.rank(TOP_K)
+        self._write_lock = threading.Lock()
+        if substrings:
+            self.substring_index()
+
+    def _note_frequencies(self, entries):
+        '''
+        Pass (word, frequency) pairs through, recording whether the word
+        file has a frequency column.
+        '''
+        for word, frequency in entries:
+            if frequency is not None:
+                self.ranked = True
+            yield word, frequency
 
     def is_word(self, w):
         '''
@@ -40,9 +78,7 @@ class EnglishDictionary(object):
 
         Returns: boolean
         '''
-        if self.words.get_node(w) is None:
-            return False
-        return self.words.get_node(w).final
+        return self._node_is_word(self.words.get_node(w))
 
     def num_completions(self, prefix):
         '''
@@ -54,29 +90,426 @@ class EnglishDictionary(object):
 
         Returns: int
         '''
-        if self.words.get_node(prefix) is not None:
-            return self.words.get_node(prefix).count
-        ### GRADER COMMENT
-        # get_node(prefix) is called twice here. Would be better
-        # to save it as a variable.
-        # Penalty: -2 Style
-        return 0
+        return self._node_count(self.words.get_node(prefix))
 
-    def get_completions(self, prefix):
+    def get_completions(self, prefix, k=None):
         '''
         Get the suffixes in the dictionary of words that start with the
         specified prefix.
 
         Inputs:
             prefix (string): the prefix
+            k (int or None): if given, only the k most frequent completions
+                are returned, most frequent first (ties, and dictionaries
+                without frequencies, in lexicographic order)
 
         Returns: list of strings.
         '''
-        ### GRADER COMMENT
-        # .get_node(prefix) could return None and result in exception:
-        # 'NoneType' object has no attribute 'get_suffixes'
-        # Penalty: reflected in Test Cases rubric.
-        return self.words.get_node(prefix).get_suffixes()
+        return self._node_completions(self.words.get_node(prefix), k)
+
+    def iter_completions(self, prefix, limit=None):
+        '''
+        Lazily generate the suffixes of the words that start with the
+        specified prefix, in lexicographic order. Nothing below the prefix
+        is visited once limit suffixes have been produced.
+
+        Inputs:
+            prefix (string): the prefix
+            limit (int or None): maximum number of suffixes to generate
+
+        Returns: generator of strings.
+        '''
+        return self._node_iter(self.words.get_node(prefix), limit)
+
+    def is_word_many(self, words):
+        '''
+        Check a batch of strings at once. See lookup_many.
+
+        Inputs:
+            words (iterable of strings): the words to check
+
+        Returns: list of booleans, in the order of words
+        '''
+        return lookup_many(self, words)
+
+    def check_stream(self, f):
+        '''
+        Spellcheck a text file a batch of lines at a time. A word passes if
+        it, or its lowercase form, is in the dictionary, so capitalized
+        words at the start of a sentence are accepted.
+
+        Inputs:
+            f (file object): the open text file
+
+        Returns: generator of (line number, column, word) for every
+            misspelled word, both counting from 1
+        '''
+        for first_line, lines in batch_lines(f, CHECK_BATCH):
+            misspelled, _ = check_lines(self, lines, first_line)
+            yield from misspelled
+
+    def fuzzy_versions(self, word, max_edits=1):
+        '''
+        Find the words within max_edits edits (insertions, deletions and
+        substitutions) of a possibly misspelled word. Substituting a letter
+        that is next to the intended one on the keyboard only costs
+        NEARBY_COST.
+
+        Inputs:
+            word (string): the word to correct
+            max_edits (float): edit budget
+
+        Returns: list of strings, closest first.
+        '''
+        return fuzzy_search(self.words,
+                            lambda node: node.letters_to_node.items(),
+                            lambda node: node.final, word, max_edits)
+
+    def find_containing(self, fragment, limit=None):
+        '''
+        Find the words that contain a fragment anywhere, not just at the
+        start. See substring_index.SubstringIndex.
+
+        Inputs:
+            fragment (string): the fragment
+            limit (int or None): maximum number of words to return
+
+        Returns: list of strings, in lexicographic order
+        '''
+        return self.substring_index().find_containing(fragment, limit)
+
+    def count_containing(self, fragment):
+        '''
+        Count the words that contain a fragment anywhere.
+
+        Inputs:
+            fragment (string): the fragment
+
+        Returns: int
+        '''
+        return self.substring_index().count_containing(fragment)
+
+    def substring_index(self):
+        '''
+        The suffix array over the words of the trie, built from the trie
+        the first time it is needed and again after the words change.
+
+        Returns: substring_index.SubstringIndex
+        '''
+        import substring_index
+
+        root = self.words
+        built = getattr(self, "_substrings", None)
+        if built is None or built[0] is not root:
+            built = (root, substring_index.SubstringIndex(
+                root.iter_suffixes()))
+            self._substrings = built
+        return built[1]
+
+    def add_word(self, word, frequency=None):
+        '''
+        Add a word to the live dictionary. See update.
+
+        Inputs:
+            word (string): the word to add
+            frequency (int or None): how common the word is
+
+        Returns: True if the word was new
+        '''
+        return self.update(add=[(word, frequency)])[0] == 1
+
+    def remove_word(self, word):
+        '''
+        Remove a word from the live dictionary. See update.
+
+        Inputs:
+            word (string): the word to remove
+
+        Returns: True if the word was in the dictionary
+        '''
+        return self.update(remove=[word])[1] == 1
+
+    def update(self, add=(), remove=()):
+        '''
+        Apply a batch of additions and removals as one new version of the
+        trie. Published nodes are never modified: every node on the path of
+        a changed word is copied once per batch (copy-on-write), the copies
+        are updated, and the new root is swapped in with a single
+        assignment when the batch is complete. Readers, cursors and
+        snapshots that started on the old root keep seeing the old version
+        and never wait for a writer; writers are serialized by a lock.
+
+        Inputs:
+            add (iterable): (word, frequency) pairs to add
+            remove (iterable of strings): words to remove
+
+        Returns: (number of words added, number of words removed)
+        '''
+        with self._write_lock:
+            root = self.words.copy()
+            # Nodes copied in this batch, which may be changed in place,
+            # with their depth.
+            fresh = {id(root): (0, root)}
+            added = 0
+            removed = 0
+            # Whether the batch brings the first frequency
+            ranks_now = False
+            for word, frequency in add:
+                node = root.get_node(word)
+                if node is not None and node.final:
+                    continue
+                if frequency is not None and not self.ranked:
+                    ranks_now = True
+                path = self._copy_path(root, word, fresh)
+                path[-1].final = True
+                path[-1].frequency = frequency or 0
+                for node in path:
+                    node.count += 1
+                added += 1
+            for word in remove:
+                node = root.get_node(word)
+                if node is None or not node.final:
+                    continue
+                path = self._copy_path(root, word, fresh)
+                path[-1].final = False
+                path[-1].frequency = 0
+                for node in path:
+                    node.count -= 1
+                # Drop the nodes that no longer lead to any word.
+                for i in range(len(word), 0, -1):
+                    if path[i].count > 0:
+                        break
+                    del path[i - 1].letters_to_node[word[i - 1]]
+                removed += 1
+            if self.ranked:
+                # Deepest first, so every node's children are up to date.
+                for _, node in sorted(fresh.values(), key=lambda e: -e[0]):
+                    node.refresh_top(TOP_K)
+            elif ranks_now:
+                # No node has a cache yet, so rank the whole new version.
+                # The shared subtrees are unchanged, so their caches hold
+                # for the old version too.
+                root.rank(TOP_K)
+            self.words = root
+            if ranks_now:
+                self.ranked = True
+        return added, removed
+
+    def _copy_path(self, root, word, fresh):
+        '''
+        Helper for update: make every node on the path of word (creating
+        missing ones) a node of this batch.
+
+        Output:
+            path (list): the batch's nodes for word[:0], word[:1], ...
+        '''
+        node = root
+        path = [root]
+        for depth, letter in enumerate(word, 1):
+            child = node.letters_to_node.get(letter)
+            if child is None:
+                child = TrieNode(letter)
+            elif id(child) not in fresh:
+                child = child.copy()
+            fresh[id(child)] = (depth, child)
+            node.letters_to_node[letter] = child
+            path.append(child)
+            node = child
+        return path
+
+    def snapshot(self):
+        '''
+        Get a read-only view of the current version of the dictionary. The
+        view shares all of its nodes with the live dictionary but is not
+        affected by later updates.
+
+        Returns: EnglishDictionary
+        '''
+        view = EnglishDictionary.__new__(EnglishDictionary)
+        view.words = self.words
+        view.ranked = self.ranked
+        view._write_lock = threading.Lock()
+        return view
+
+    def cursor(self):
+        '''
+        Start a cursor at the root of the trie, for answering queries about
+        a prefix that is typed one letter at a time.
+
+        Returns: TrieCursor
+        '''
+        return TrieCursor(self)
+
+    def save(self, path):
+        '''
+        Write the trie to a compact binary snapshot.
+
+        Inputs:
+            path (string): name of the snapshot file
+        '''
+        import english_dictionary_compact
+
+        english_dictionary_compact.write_snapshot(path, self._sections())
+
+    def to_shared_memory(self, name=None):
+        '''
+        Flatten the trie into a new shared memory segment, in the same
+        format as save(). Worker processes open it, read-only and without
+        copying, with english_dictionary_compact.EnglishDictionary.attach.
+        The caller must close() and unlink() the segment when they are done.
+
+        Inputs:
+            name (string or None): name for the segment; None picks one
+
+        Returns: multiprocessing.shared_memory.SharedMemory
+        '''
+        import english_dictionary_compact
+
+        return english_dictionary_compact.share_snapshot(self._sections(),
+                                                         name)
+
+    def _sections(self):
+        '''
+        Flatten the trie into the arrays of a snapshot, by section name.
+        '''
+        import english_dictionary_compact
+
+        labels, first, count, final, freq = self.words.to_arrays()
+        sections = {"labels": labels, "first": first, "count": count,
+                    "final": final}
+        if self.ranked:
+            sections.update(english_dictionary_compact.rank_arrays(
+                labels, first, count, final, freq, TOP_K))
+        return sections
+
+    @staticmethod
+    def load(path):
+        '''
+        Open a snapshot written by save(). The snapshot is memory-mapped and
+        queried in place by the array-backed dictionary, which has the same
+        interface as this one.
+
+        Inputs:
+            path (string): name of the snapshot file
+
+        Returns: english_dictionary_compact.EnglishDictionary
+        '''
+        import english_dictionary_compact
+
+        return english_dictionary_compact.EnglishDictionary.load(path)
+
+    # Node-level versions of the queries above, shared with TrieCursor. A
+    # node of None stands for a prefix that is not in the trie.
+
+    def _root(self):
+        return self.words
+
+    def _child(self, node, letter):
+        if node is None:
+            return None
+        return node.letters_to_node.get(letter)
+
+    def _node_is_word(self, node):
+        return node is not None and node.final
+
+    def _node_count(self, node):
+        if node is None:
+            return 0
+        return node.count
+
+    def _node_iter(self, node, limit):
+        if node is None:
+            return iter(())
+        return islice(node.iter_suffixes(), limit)
+
+    def _node_completions(self, node, k):
+        if k is None or not self.ranked:
+            return list(self._node_iter(node, k))
+        if node is None:
+            return []
+        return node.best_suffixes(k)
+
+
+class TrieCursor(object):
+    def __init__(self, eng_dict):
+        '''
+        Constructor for a cursor over a dictionary's trie. The cursor keeps
+        the stack of nodes along the prefix typed so far, so typing a letter
+        is one child lookup and Backspace is a pop, instead of a walk from
+        the root on every keystroke.
+
+        Inputs:
+            eng_dict: the EnglishDictionary (of any trie backend) to walk
+        '''
+        self._dict = eng_dict
+        self.reset()
+
+    @property
+    def prefix(self):
+        '''
+        The letters typed so far.
+        '''
+        return "".join(self._letters)
+
+    def reset(self):
+        '''
+        Move the cursor back to the root (the empty prefix).
+        '''
+        self._letters = []
+        self._nodes = [self._dict._root()]
+
+    def advance(self, letter):
+        '''
+        Extend the prefix by one letter. Letters that leave the trie are
+        still tracked, so that Backspace can undo them.
+
+        Inputs:
+            letter (string): the letter typed
+        '''
+        self._letters.append(letter)
+        self._nodes.append(self._dict._child(self._nodes[-1], letter))
+
+    def backspace(self):
+        '''
+        Remove the last letter of the prefix, if there is one.
+        '''
+        if self._letters:
+            self._letters.pop()
+            self._nodes.pop()
+
+    def is_word(self):
+        '''
+        Is the prefix typed so far a word?
+
+        Returns: boolean
+        '''
+        return self._dict._node_is_word(self._nodes[-1])
+
+    def num_completions(self):
+        '''
+        How many words start with the prefix typed so far?
+
+        Returns: int
+        '''
+        return self._dict._node_count(self._nodes[-1])
+
+    def get_completions(self, k=None):
+        '''
+        Get the suffixes of the words that start with the prefix typed so
+        far; see EnglishDictionary.get_completions.
+
+        Returns: list of strings.
+        '''
+        return self._dict._node_completions(self._nodes[-1], k)
+
+    def iter_completions(self, limit=None):
+        '''
+        Lazily generate the suffixes of the words that start with the prefix
+        typed so far; see EnglishDictionary.iter_completions.
+
+        Returns: generator of strings.
+        '''
+        return self._dict._node_iter(self._nodes[-1], limit)
 
 
 class TrieNode(object):
@@ -96,26 +529,87 @@ class TrieNode(object):
         self.final = final
         self.letter = letter
         self.letters_to_node = {}
+        self.frequency = 0
+        # Best completions below this node, filled in by rank()
+        self._top = None
+
+    def copy(self):
+        '''
+        Method that makes a shallow copy of this node: the copy has its own
+        map of children, but the children themselves are shared.
 
-    def add_word(self, word):
+        Output:
+            TrieNode
+        '''
+        node = TrieNode(self.letter, self.final)
+        node.count = self.count
+        node.frequency = self.frequency
+        node.letters_to_node = dict(self.letters_to_node)
+        node._top = self._top
+        return node
+
+    def add_word(self, word, frequency=None):
         '''
         Method that takes a word and adds it to the trie by constructing trie
         objects and updating all of the trie attributes.
 
         Input:
             word (str): the word to be integrated into the trie
+            frequency (int or None): how common the word is
+        Output:
+            True if the word was new, False if it was already in the trie
         '''
-        self.count += 1
-        if len(word) == 0:
-            self.final = True
-            return None
-        if word[0] not in self.letters_to_node.keys():
-            new_node = TrieNode(word[0]) # create destination node
-            self.letters_to_node[word[0]] = new_node # create link
-            new_node.add_word(word[1:])
-        else:
-            node = self.letters_to_node[word[0]]
-            node.add_word(word[1:])
+        return self.add_words([(word, frequency)]) == 1
+
+    def add_words(self, words):
+        '''
+        Method that inserts a stream of words iteratively. The path of the
+        previous word is kept, so a word only walks the trie from the end of
+        the prefix it shares with the word before it; on sorted input most
+        of every word is already in place. A word that turns out to be final
+        already is a duplicate and leaves the counts untouched.
+
+        Input:
+            words (iterable of tuples): (word, frequency) pairs to be
+                integrated into the trie; frequency may be None
+        Output:
+            added (int): number of words that were not already in the trie
+        '''
+        with paused_gc():
+            return self._add_words(words)
+
+    def _add_words(self, words):
+        '''
+        Helper for add_words that does the actual insertion.
+        '''
+        added = 0
+        previous = ""
+        path = [self] # path[i] is the node reached by previous[:i]
+        for word, frequency in words:
+            shared = 0
+            limit = min(len(word), len(previous))
+            while shared < limit and word[shared] == previous[shared]:
+                shared += 1
+            del path[shared + 1:]
+            node = path[shared]
+            for i in range(shared, len(word)):
+                letter = word[i]
+                child = node.letters_to_node.get(letter)
+                if child is None:
+                    child = TrieNode(letter)
+                    node.letters_to_node[letter] = child
+                path.append(child)
+                node = child
+            previous = word
+            if node.final:
+                continue
+            node.final = True
+            node.frequency = frequency or 0
+            for visited in path:
+                visited.count += 1
+                visited._top = None
+            added += 1
+        return added
 
     def get_node(self, word):
         '''
@@ -127,12 +621,41 @@ class TrieNode(object):
         Outputs:
             The correspondent node or None.
         '''
-        if len(word) == 0:
-            return self
-        elif word[0] not in self.letters_to_node.keys():
-            return None
-        else:
-            return self.letters_to_node[word[0]].get_node(word[1:])
+        node = self
+        for letter in word:
+            node = node.letters_to_node.get(letter)
+            if node is None:
+                return None
+        return node
+
+    def to_arrays(self):
+        '''
+        Method that lays the trie below this node out in the flat,
+        breadth-first arrays used by english_dictionary_compact.
+
+        Output:
+            labels, first, count (array of unsigned int), final (bytearray),
+            freq (array of unsigned long long)
+        '''
+        labels = array('I', [0])
+        first = array('I')
+        count = array('I', [self.count])
+        final = bytearray([self.final])
+        freq = array('Q', [self.frequency])
+        queue = deque([self])
+        while queue:
+            node = queue.popleft()
+            first.append(len(labels))
+            for letter in sorted(node.letters_to_node):
+                child = node.letters_to_node[letter]
+                labels.append(ord(letter))
+                count.append(child.count)
+                final.append(child.final)
+                freq.append(child.frequency)
+                queue.append(child)
+        first.append(len(labels))
+
+        return labels, first, count, final, freq
 
     def get_suffixes(self):
         '''
@@ -143,18 +666,284 @@ class TrieNode(object):
         Output:
             lst (list): list of suffixes
         '''
-        lst = []
-        if self.letters_to_node == {}:
-            return ['']
-        for obj in self.letters_to_node.values():
-            suffixes = obj.get_suffixes()
-            if obj.final is True:
-                lst.append(obj.letter)
-            for s in suffixes:
-                suffix = obj.letter + s
-                if suffix not in lst:
-                    lst.append(obj.letter + s)
-        return lst
+        return list(self.iter_suffixes())
+
+    def iter_suffixes(self, frequencies=False):
+        '''
+        Generator version of get_suffixes. Walks the subtree depth first
+        with an explicit stack, visiting children in letter order, so the
+        suffixes come out in lexicographic order without building or
+        deduplicating a list. The empty suffix comes first if this node is
+        itself the end of a word.
+
+        Input:
+            frequencies (bool): generate (frequency, suffix) pairs instead
+        Output:
+            generator of str
+        '''
+        path = []
+        # Each entry is (node, depth of that node below self).
+        stack = [(self, 0)]
+        while stack:
+            node, depth = stack.pop()
+            if depth > 0:
+                del path[depth - 1:]
+                path.append(node.letter)
+            if node.final:
+                if frequencies:
+                    yield node.frequency, "".join(path)
+                else:
+                    yield "".join(path)
+            children = node.letters_to_node
+            for letter in sorted(children, reverse=True):
+                stack.append((children[letter], depth + 1))
+
+    def rank(self, k):
+        '''
+        Method that precomputes, bottom up, the k most frequent completions
+        of every node in this subtree and caches them on the nodes that
+        have more than k words below them. Smaller subtrees are cheap enough
+        to rank on demand.
+
+        Input:
+            k (int): number of completions to keep per node
+        Output:
+            best (list): (-frequency, suffix) pairs of the k best
+                completions of this node, best first
+        '''
+        with paused_gc():
+            return self._rank(k)
+
+    def _rank(self, k):
+        '''
+        Helper for rank that does the actual work. Walks the subtree post
+        order with an explicit stack, so that long words do not run into
+        the recursion limit; a node is ranked once all of its children
+        are, from their lists, which wait in ranked until then.
+        '''
+        ranked = {}
+        # Each entry is (node, whether its children are ranked already).
+        stack = [(self, False)]
+        while stack:
+            node, children_done = stack.pop()
+            children = node.letters_to_node
+            if not children_done:
+                stack.append((node, True))
+                stack.extend((child, False) for child in children.values())
+                continue
+            best = [(-node.frequency, "")] if node.final else []
+            for letter, child in children.items():
+                best.extend((f, letter + s) for f, s in ranked.pop(child))
+            if len(best) > k:
+                best = heapq.nsmallest(k, best)
+            else:
+                best.sort()
+            node._top = best if node.count > k else None
+            ranked[node] = best
+        return ranked[self]
+
+    def refresh_top(self, k):
+        '''
+        Method that recomputes this node's cached completions from its
+        children after an update, assuming the children's caches are
+        current.
+
+        Input:
+            k (int): number of completions to keep
+        '''
+        if self.count <= k:
+            self._top = None
+            return
+        best = [(-self.frequency, "")] if self.final else []
+        for letter, child in self.letters_to_node.items():
+            top = child._top
+            if top is None:
+                top = [(-f, s) for f, s in
+                       child.iter_suffixes(frequencies=True)]
+            best.extend((f, letter + s) for f, s in top)
+        self._top = heapq.nsmallest(k, best)
+
+    def best_suffixes(self, k):
+        '''
+        Method that returns the k most frequent completions of this node,
+        from the cache built by rank() when it covers k, and otherwise by
+        ranking the subtree.
+
+        Input:
+            k (int): number of completions wanted
+        Output:
+            lst (list): suffixes, most frequent first
+        '''
+        best = self._top
+        if best is None or len(best) < k:
+            best = heapq.nsmallest(k, ((-f, s) for f, s in
+                                       self.iter_suffixes(frequencies=True)))
+        return [s for _, s in best[:k]]
+
+
+def fuzzy_search(root, children, is_final, word, max_edits):
+    '''
+    Walk a trie once, keeping one row of the weighted edit-distance table
+    per node on the current path: row[j] is the cost of turning word[:j]
+    into the node's prefix. A child's row is computed from its parent's, so
+    shared prefixes are only scored once, and a subtree is skipped as soon
+    as every entry of its row is over budget. The trie is reached only
+    through the two callbacks, so any backend can use this.
+
+    Input:
+        root: the root node
+        children (function): maps a node to (letter, child) pairs
+        is_final (function): tells whether a node ends a word
+        word (str): the word to correct
+        max_edits (float): edit budget
+    Output:
+        list of str: the words within budget, closest first
+    '''
+    n = len(word)
+    nearby = [set(autocorrect_shell.nearby_keys(c)) for c in word]
+    found = []
+    path = []
+    # Each entry is (node, letter into it, its depth, its row).
+    stack = [(root, "", 0, list(range(n + 1)))]
+    while stack:
+        node, letter, depth, row = stack.pop()
+        if depth > 0:
+            del path[depth - 1:]
+            path.append(letter)
+        if is_final(node) and row[n] <= max_edits:
+            found.append((row[n], "".join(path)))
+        for letter, child in children(node):
+            new_row = [row[0] + 1]
+            for j in range(1, n + 1):
+                if word[j - 1] == letter:
+                    substitute = row[j - 1]
+                elif letter in nearby[j - 1]:
+                    substitute = row[j - 1] + NEARBY_COST
+                else:
+                    substitute = row[j - 1] + 1
+                new_row.append(min(substitute, row[j] + 1,
+                                   new_row[j - 1] + 1))
+            if min(new_row) <= max_edits:
+                stack.append((child, letter, depth + 1, new_row))
+    found.sort()
+    return [w for _, w in found]
+
+
+def lookup_many(eng_dict, words):
+    '''
+    Look up a batch of words through a dictionary's node-level hooks. Each
+    distinct word is looked up once, in sorted order, and every lookup
+    resumes from the path of the previous word instead of from the root,
+    so a batch costs about one step per letter not shared with its sorted
+    neighbour.
+
+    Input:
+        eng_dict: an EnglishDictionary of one of the trie backends
+        words (iterable of str): the words to check
+    Output:
+        list of bool, in the order of words
+    '''
+    words = list(words)
+    found = {}
+    previous = ""
+    path = [eng_dict._root()] # path[i] is the node reached by previous[:i]
+    for word in sorted(set(words)):
+        shared = 0
+        limit = min(len(word), len(previous))
+        while shared < limit and word[shared] == previous[shared]:
+            shared += 1
+        del path[shared + 1:]
+        node = path[shared]
+        for i in range(shared, len(word)):
+            node = eng_dict._child(node, word[i])
+            path.append(node)
+        found[word] = eng_dict._node_is_word(node)
+        previous = word
+    return [found[word] for word in words]
+
+
+def check_lines(eng_dict, lines, first_line=1):
+    '''
+    Spellcheck a batch of lines of text.
+
+    Input:
+        eng_dict: an EnglishDictionary of one of the trie backends
+        lines (list of str): the lines
+        first_line (int): line number of lines[0]
+    Output:
+        misspelled (list): (line number, column, word) of every misspelled
+            word, the column counting from 1
+        n (int): number of words checked
+    '''
+    tokens = []
+    for i, line in enumerate(lines, first_line):
+        for match in WORD_RE.finditer(line):
+            tokens.append((i, match.start() + 1, match.group()))
+
+    distinct = list({w for _, _, w in tokens})
+    known = dict(zip(distinct, lookup_many(eng_dict, distinct)))
+    unknown = [w for w in distinct if not known[w]]
+    known.update(zip(unknown, lookup_many(eng_dict,
+                                          [w.lower() for w in unknown])))
+
+    return [t for t in tokens if not known[t[2]]], len(tokens)
+
+
+def batch_lines(f, n):
+    '''
+    Group the lines of a file into lists of at most n lines.
+
+    Input:
+        f (file object): the open file
+        n (int): number of lines per batch
+    Output:
+        generator of (line number of the batch's first line, list of str)
+    '''
+    first_line = 1
+    while True:
+        lines = list(islice(f, n))
+        if not lines:
+            return
+        yield first_line, lines
+        first_line += len(lines)
+
+
+@contextmanager
+def paused_gc():
+    '''
+    Pause the cyclic garbage collector for the duration of a with block.
+    Building or ranking the trie allocates a node or a list per letter and
+    none of it is garbage, so the collections that these allocations would
+    trigger are wasted work.
+    '''
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+def read_words(f):
+    '''
+    Stream the words out of an open word file, one per line, skipping blank
+    lines. A line may carry the word's frequency after a tab.
+
+    Input:
+        f (file object): the open word file
+    Output:
+        generator of (word, frequency) pairs; frequency is None when the
+        line has no frequency column, or an empty or invalid one
+    '''
+    for line in f:
+        w, _, frequency = line.partition("\t")
+        w = w.strip()
+        if w != "":
+            try:
+                yield w, int(frequency)
+            except ValueError:
+                yield w, None
 
 
 if __name__ == "__main__":
@@ -0,0 +1,737 @@
+# CS122: Auto-completing keyboard using Tries
+# Compact array-backed trie
+#
+# Antony Awad
+#
+# Same interface as english_dictionary.py, but instead of one TrieNode
+# object (and one dict) per character the whole trie lives in a handful of
+# flat typed arrays. Nodes are numbered in breadth-first order, so the
+# children of every node occupy a contiguous, label-sorted block:
+#
+#   _labels[i]    code point of the letter on the edge into node i
+#   _first[i]     index of node i's first child; its children are the
+#                 nodes _first[i] .. _first[i + 1] - 1
+#   _count[i]     number of words in the subtree rooted at node i
+#   _final[i]     1 if the path to node i spells a word
+#
+# Looking up a child is a binary search inside its parent's block.
+#
+# When the word file has a frequency column, rank_arrays() adds the arrays
+# used for ranked completions:
+#
+#   _freq[i]      frequency of the word ending at node i
+#   _parent[i]    parent of node i, to spell a word back from its end
+#   _topnodes     for every node with more than TOP_K words below it, the
+#                 end nodes of its TOP_K most frequent completions, best
+#                 first, at _topnodes[_topfirst[i]:_topfirst[i + 1]]
+#
+# The same arrays can be written to a snapshot file with save() and opened
+# again with load(). A snapshot is an 8-byte magic, a section table and the
+# raw array contents; load() maps the file with mmap and casts each section
+# to a memoryview, so the trie is queried straight out of the page cache
+# with no deserialization pass. to_shared_memory() and attach() do the same
+# with a multiprocessing.shared_memory segment instead of a file.
+
+from array import array
+from bisect import bisect_left
+from collections import deque
+from itertools import islice
+import heapq
+import mmap
+from multiprocessing.shared_memory import SharedMemory
+import struct
+import sys
+import weakref
+
+import autocorrect_shell
+from english_dictionary import (batch_lines, check_lines, CHECK_BATCH,
+                                fuzzy_search, lookup_many, paused_gc,
+                                read_words, TrieCursor, TOP_K)
+from substring_index import SubstringIndex
+
+
+class EnglishDictionary(object):
+    def __init__(self, wordfile, substrings=False):
+        '''
+        Constructor
+
+        Inputs:
+            wordfile (string): name of the file with the words.
+            substrings (boolean): build the substring index now instead of
+                on the first find_containing or count_containing
+        '''
+        entries = {}
+        with open(wordfile) as f:
+            for w, frequency in read_words(f):
+                entries.setdefault(w, frequency)
+        words = sorted(entries)
+        self.ranked = any(f is not None for f in entries.values())
+        with paused_gc():
+            self._labels, self._first, self._count, self._final, freq = \
+                build_arrays(words, [entries[w] or 0 for w in words])
+            if self.ranked:
+                ranking = rank_arrays(self._labels, self._first,
+                                      self._count, self._final, freq, TOP_K)
+                for name in RANK_SECTIONS:
+                    setattr(self, "_" + name, ranking[name])
+        self._substrings = SubstringIndex(words) if substrings else None
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Open a snapshot written by save(). The file is memory-mapped and
+        queried in place, so loading takes constant time and processes
+        that load the same snapshot share its pages.
+
+        Inputs:
+            path (string): name of the snapshot file
+
+        Returns: EnglishDictionary
+        '''
+        return cls._from_sections(open_snapshot(path))
+
+    def save(self, path):
+        '''
+        Write the trie to a snapshot file that load() can map back in.
+
+        Inputs:
+            path (string): name of the snapshot file
+        '''
+        write_snapshot(path, self._sections())
+
+    def to_shared_memory(self, name=None):
+        '''
+        Copy the trie, in snapshot format, into a new shared memory segment
+        that other processes can attach() to. The caller owns the segment
+        and must close() and unlink() it when the workers are done.
+
+        Inputs:
+            name (string or None): name for the segment; None picks one
+
+        Returns: multiprocessing.shared_memory.SharedMemory
+        '''
+        return share_snapshot(self._sections(), name)
+
+    @classmethod
+    def attach(cls, name):
+        '''
+        Attach to a trie placed in shared memory by to_shared_memory. The
+        arrays are cast straight out of the segment, so attaching takes
+        constant time and every process reads the same physical pages.
+
+        Processes started by the segment's creator share its resource
+        tracker, so attaching does not make the segment outlive, or die
+        with, the attaching process.
+
+        The segment cannot be closed while views of it exist, so the views
+        are released before it when the dictionary is closed, garbage
+        collected, or still open at exit.
+
+        Inputs:
+            name (string): name of the segment
+
+        Returns: EnglishDictionary
+        '''
+        shm = SharedMemory(name=name)
+        sections = read_snapshot(shm.buf, name)
+        eng_dict = cls._from_sections(sections)
+        eng_dict._detach = weakref.finalize(eng_dict, release_sections,
+                                            sections, shm)
+        return eng_dict
+
+    def close(self):
+        '''
+        Release the shared memory segment of an attached dictionary. The
+        dictionary cannot be used afterwards.
+        '''
+        detach = getattr(self, "_detach", None)
+        if detach is None:
+            return
+        for name in SECTIONS + RANK_SECTIONS:
+            self.__dict__.pop("_" + name, None)
+        self._substrings = None
+        detach()
+
+    def add_word(self, word, frequency=None):
+        '''
+        The compact trie is read-only; see update.
+        '''
+        self.update(add=[(word, frequency)])
+
+    def remove_word(self, word):
+        '''
+        The compact trie is read-only; see update.
+        '''
+        self.update(remove=[word])
+
+    def update(self, add=(), remove=()):
+        '''
+        The flat arrays cannot be changed in place, so this dictionary is
+        read-only. Build an english_dictionary.EnglishDictionary to add or
+        remove words, and save() it to a new snapshot.
+
+        Raises: TypeError
+        '''
+        raise TypeError("the compact dictionary is read-only; use "
+                        "english_dictionary.EnglishDictionary to add or "
+                        "remove words")
+
+    def snapshot(self):
+        '''
+        Get a read-only view of the dictionary. The compact trie never
+        changes, so it is its own snapshot.
+
+        Returns: EnglishDictionary
+        '''
+        return self
+
+    @classmethod
+    def _from_sections(cls, sections):
+        '''
+        Make a dictionary out of the sections of a snapshot.
+        '''
+        eng_dict = cls.__new__(cls)
+        eng_dict.ranked = "freq" in sections
+        eng_dict._substrings = None
+        for name in SECTIONS + (RANK_SECTIONS if eng_dict.ranked else ()):
+            setattr(eng_dict, "_" + name, sections[name])
+        return eng_dict
+
+    def _sections(self):
+        '''
+        The arrays to store in a snapshot, by section name.
+        '''
+        names = SECTIONS + (RANK_SECTIONS if self.ranked else ())
+        return {name: getattr(self, "_" + name) for name in names}
+
+    def is_word(self, w):
+        '''
+        Is the string a word?
+
+        Inputs:
+           w (string): the word to check
+
+        Returns: boolean
+        '''
+        return self._node_is_word(self._find(w))
+
+    def num_completions(self, prefix):
+        '''
+        How many words in the dictionary start with the specified
+        prefix?
+
+        Inputs:
+            prefix (string): the prefix
+
+        Returns: int
+        '''
+        return self._node_count(self._find(prefix))
+
+    def get_completions(self, prefix, k=None):
+        '''
+        Get the suffixes in the dictionary of words that start with the
+        specified prefix, in lexicographic order.
+
+        Inputs:
+            prefix (string): the prefix
+            k (int or None): if given, only the k most frequent completions
+                are returned, most frequent first (ties, and dictionaries
+                without frequencies, in lexicographic order)
+
+        Returns: list of strings.
+        '''
+        return self._node_completions(self._find(prefix), k)
+
+    def iter_completions(self, prefix, limit=None):
+        '''
+        Lazily generate the suffixes of the words that start with the
+        specified prefix, in lexicographic order, stopping after limit
+        suffixes.
+
+        Inputs:
+            prefix (string): the prefix
+            limit (int or None): maximum number of suffixes to generate
+
+        Returns: generator of strings.
+        '''
+        return self._node_iter(self._find(prefix), limit)
+
+    def is_word_many(self, words):
+        '''
+        Check a batch of strings at once. See english_dictionary.lookup_many.
+
+        Inputs:
+            words (iterable of strings): the words to check
+
+        Returns: list of booleans, in the order of words
+        '''
+        return lookup_many(self, words)
+
+    def check_stream(self, f):
+        '''
+        Spellcheck a text file a batch of lines at a time. A word passes if
+        it, or its lowercase form, is in the dictionary.
+
+        Inputs:
+            f (file object): the open text file
+
+        Returns: generator of (line number, column, word) for every
+            misspelled word, both counting from 1
+        '''
+        for first_line, lines in batch_lines(f, CHECK_BATCH):
+            misspelled, _ = check_lines(self, lines, first_line)
+            yield from misspelled
+
+    def fuzzy_versions(self, word, max_edits=1):
+        '''
+        Find the words within max_edits edits (insertions, deletions and
+        substitutions) of a possibly misspelled word. Substituting a letter
+        that is next to the intended one on the keyboard only costs
+        NEARBY_COST.
+
+        Inputs:
+            word (string): the word to correct
+            max_edits (float): edit budget
+
+        Returns: list of strings, closest first.
+        '''
+        return fuzzy_search(0, self._children, self._final.__getitem__,
+                            word, max_edits)
+
+    def find_containing(self, fragment, limit=None):
+        '''
+        Find the words that contain a fragment anywhere, not just at the
+        start. See substring_index.SubstringIndex.
+
+        Inputs:
+            fragment (string): the fragment
+            limit (int or None): maximum number of words to return
+
+        Returns: list of strings, in lexicographic order
+        '''
+        return self.substring_index().find_containing(fragment, limit)
+
+    def count_containing(self, fragment):
+        '''
+        Count the words that contain a fragment anywhere.
+
+        Inputs:
+            fragment (string): the fragment
+
+        Returns: int
+        '''
+        return self.substring_index().count_containing(fragment)
+
+    def substring_index(self):
+        '''
+        The suffix array over the words, built from the trie the first time
+        it is needed unless the constructor already built it.
+
+        Returns: substring_index.SubstringIndex
+        '''
+        if self._substrings is None:
+            self._substrings = SubstringIndex(self._suffixes(0))
+        return self._substrings
+
+    def cursor(self):
+        '''
+        Start a cursor at the root of the trie, for answering queries about
+        a prefix that is typed one letter at a time.
+
+        Returns: english_dictionary.TrieCursor
+        '''
+        return TrieCursor(self)
+
+    # Node-level versions of the queries above, shared with TrieCursor. A
+    # node of -1 stands for a prefix that is not in the trie.
+
+    def _root(self):
+        return 0
+
+    def _child(self, node, letter):
+        if node < 0:
+            return -1
+        labels = self._labels
+        code = ord(letter)
+        lo = self._first[node]
+        hi = self._first[node + 1]
+        child = bisect_left(labels, code, lo, hi)
+        if child == hi or labels[child] != code:
+            return -1
+        return child
+
+    def _node_is_word(self, node):
+        return node >= 0 and self._final[node] == 1
+
+    def _node_count(self, node):
+        if node < 0:
+            return 0
+        return self._count[node]
+
+    def _node_iter(self, node, limit):
+        if node < 0:
+            return iter(())
+        return islice(self._suffixes(node), limit)
+
+    def _node_completions(self, node, k):
+        if k is None or not self.ranked:
+            return list(self._node_iter(node, k))
+        if node < 0:
+            return []
+
+        lo = self._topfirst[node]
+        hi = self._topfirst[node + 1]
+        if hi - lo >= k:
+            return [self._spell(end, node)
+                    for end in self._topnodes[lo:lo + k]]
+        freq = self._freq
+        best = heapq.nsmallest(k, ((-freq[end], i, suffix) for i, (end, suffix)
+                                   in enumerate(self._walk(node))))
+        return [suffix for _, _, suffix in best]
+
+    def _children(self, node):
+        '''
+        Generate the (letter, child) pairs of a node.
+        '''
+        labels = self._labels
+        for child in range(self._first[node], self._first[node + 1]):
+            yield chr(labels[child]), child
+
+    def _find(self, prefix):
+        '''
+        Walk the trie along prefix.
+
+        Input:
+            prefix (str): the letters to follow from the root
+        Output:
+            index of the node reached, or -1 if prefix leaves the trie
+        '''
+        labels = self._labels
+        first = self._first
+        node = 0
+        for ch in prefix:
+            code = ord(ch)
+            lo = first[node]
+            hi = first[node + 1]
+            node = bisect_left(labels, code, lo, hi)
+            if node == hi or labels[node] != code:
+                return -1
+        return node
+
+    def _spell(self, end, node):
+        '''
+        Spell the path from node down to one of its descendants.
+
+        Input:
+            end (int): index of the descendant
+            node (int): index of the ancestor
+        Output:
+            str
+        '''
+        labels = self._labels
+        parent = self._parent
+        letters = []
+        while end != node:
+            letters.append(chr(labels[end]))
+            end = parent[end]
+        return "".join(reversed(letters))
+
+    def _suffixes(self, node):
+        '''
+        Generate the suffixes of every word below node, depth first and in
+        lexicographic order.
+
+        Input:
+            node (int): index of the node to start from
+        Output:
+            generator of strings
+        '''
+        return (suffix for _, suffix in self._walk(node))
+
+    def _walk(self, node):
+        '''
+        Generate the words below node, depth first and in lexicographic
+        order.
+
+        Input:
+            node (int): index of the node to start from
+        Output:
+            generator of (index of the word's end node, suffix) pairs
+        '''
+        labels = self._labels
+        first = self._first
+        final = self._final
+        path = []
+        # Each entry is (node, depth of that node below the start node).
+        stack = [(node, 0)]
+        while stack:
+            node, depth = stack.pop()
+            if depth > 0:
+                del path[depth - 1:]
+                path.append(chr(labels[node]))
+            if final[node]:
+                yield node, "".join(path)
+            for child in range(first[node + 1] - 1, first[node] - 1, -1):
+                stack.append((child, depth + 1))
+
+
+def build_arrays(words, frequencies):
+    '''
+    Lay out the trie for a list of words as flat arrays in breadth-first
+    order.
+
+    Input:
+        words (list of str): sorted list of distinct, non-empty words
+        frequencies (list of int): frequency of each word
+    Output:
+        labels, first, count (array of unsigned int), final (bytearray),
+        freq (array of unsigned long long)
+    '''
+    labels = array('I', [0])
+    first = array('I')
+    count = array('I', [len(words)])
+    final = bytearray(1)
+    freq = array('Q', [0])
+
+    # Each queued node owns the range words[lo:hi] of words that pass
+    # through it; because the input is sorted these ranges are contiguous
+    # and a word equal to the node's prefix always comes first.
+    queue = deque([(0, len(words), 0)])
+    node = 0
+    while queue:
+        lo, hi, depth = queue.popleft()
+        first.append(len(labels))
+        if lo < hi and len(words[lo]) == depth:
+            final[node] = 1
+            freq[node] = frequencies[lo]
+            lo += 1
+        while lo < hi:
+            letter = words[lo][depth]
+            end = lo + 1
+            while end < hi and words[end][depth] == letter:
+                end += 1
+            labels.append(ord(letter))
+            count.append(end - lo)
+            final.append(0)
+            freq.append(0)
+            queue.append((lo, end, depth + 1))
+            lo = end
+        node += 1
+    first.append(len(labels))
+
+    return labels, first, count, final, freq
+
+
+def rank_arrays(labels, first, count, final, freq, k):
+    '''
+    Precompute the k most frequent completions of every node with more
+    than k words below it. Nodes are visited in reverse breadth-first
+    order, so every node is ranked after its children and merges their
+    (at most k long) lists; ties are broken by lexicographic order.
+
+    Input:
+        labels, first, count, final, freq: the arrays of a trie
+        k (int): number of completions to keep per node
+    Output:
+        dict mapping the names in RANK_SECTIONS to arrays
+    '''
+    n = len(labels)
+    parent = array('I', bytes(4 * n))
+    for node in range(n):
+        for child in range(first[node], first[node + 1]):
+            parent[child] = node
+
+    # Position of each word in lexicographic (depth-first) order
+    order = array('I', bytes(4 * n))
+    position = 0
+    stack = [0]
+    while stack:
+        node = stack.pop()
+        if final[node]:
+            order[node] = position
+            position += 1
+        stack.extend(range(first[node + 1] - 1, first[node] - 1, -1))
+
+    cached = {}
+    pending = {}
+    for node in range(n - 1, -1, -1):
+        best = [(-freq[node], order[node], node)] if final[node] else []
+        for child in range(first[node], first[node + 1]):
+            best.extend(pending.pop(child))
+        if len(best) > k:
+            best = heapq.nsmallest(k, best)
+        else:
+            best.sort()
+        pending[node] = best
+        if count[node] > k:
+            cached[node] = best
+
+    topfirst = array('I', [0])
+    topnodes = array('I')
+    for node in range(n):
+        for _, _, end in cached.get(node, ()):
+            topnodes.append(end)
+        topfirst.append(len(topnodes))
+
+    return {"freq": freq, "parent": parent, "topfirst": topfirst,
+            "topnodes": topnodes}
+
+
+# Snapshot layout: a header (magic, byte order, number of sections)
+# followed by one table entry per section (name, typecode, offset, size in
+# bytes). Sections start on 8-byte boundaries so that every cast is
+# aligned.
+MAGIC = b"EDTRIE01"
+SECTIONS = ("labels", "first", "count", "final")
+RANK_SECTIONS = ("freq", "parent", "topfirst", "topnodes")
+HEADER = struct.Struct("<8s?3xI")
+ENTRY = struct.Struct("<8sc7xQQ")
+ALIGN = 8
+
+
+def layout_snapshot(sections):
+    '''
+    Work out where every section of a snapshot goes.
+
+    Input:
+        sections (dict): maps section name to an array, bytearray or
+            memoryview
+    Output:
+        header (bytes): the header and the section table
+        parts (list): (offset, memoryview of the section's bytes) pairs
+        size (int): total size of the snapshot in bytes
+    '''
+    views = {name: memoryview(obj) for name, obj in sections.items()}
+    offset = HEADER.size + ENTRY.size * len(views)
+    header = [HEADER.pack(MAGIC, sys.byteorder == "little", len(views))]
+    parts = []
+    for name, view in views.items():
+        offset += -offset % ALIGN
+        header.append(ENTRY.pack(name.encode(), view.format.encode(),
+                                 offset, view.nbytes))
+        parts.append((offset, view.cast("B")))
+        offset += view.nbytes
+    return b"".join(header), parts, offset
+
+
+def write_snapshot(path, sections):
+    '''
+    Write named arrays to a snapshot file.
+
+    Input:
+        path (str): name of the snapshot file
+        sections (dict): maps section name to an array, bytearray or
+            memoryview
+    '''
+    header, parts, _ = layout_snapshot(sections)
+    with open(path, "wb") as f:
+        f.write(header)
+        for offset, part in parts:
+            f.write(bytes(offset - f.tell()))
+            f.write(part)
+
+
+def share_snapshot(sections, name=None):
+    '''
+    Write named arrays, in snapshot format, to a new shared memory segment.
+
+    Input:
+        sections (dict): maps section name to an array, bytearray or
+            memoryview
+        name (str or None): name for the segment; None picks one
+    Output:
+        multiprocessing.shared_memory.SharedMemory
+    '''
+    header, parts, size = layout_snapshot(sections)
+    shm = SharedMemory(name=name, create=True, size=max(size, 1))
+    shm.buf[:len(header)] = header
+    for offset, part in parts:
+        shm.buf[offset:offset + len(part)] = part
+    return shm
+
+
+def release_sections(sections, shm):
+    '''
+    Release the views of a snapshot held in shared memory, and then the
+    segment itself.
+
+    Input:
+        sections (dict): maps section name to a memoryview into shm
+        shm (SharedMemory): the segment
+    '''
+    for view in sections.values():
+        view.release()
+    shm.close()
+
+
+def open_dictionary(path):
+    '''
+    Load the dictionary from a snapshot, or build it from a word file.
+
+    Input:
+        path (str): name of the snapshot or word file
+    Output:
+        EnglishDictionary
+    '''
+    if is_snapshot(path):
+        return EnglishDictionary.load(path)
+    return EnglishDictionary(path)
+
+
+def is_snapshot(path):
+    '''
+    Tell whether a file is a snapshot written by write_snapshot.
+
+    Input:
+        path (str): name of the file
+    Output:
+        bool
+    '''
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def open_snapshot(path):
+    '''
+    Memory-map a snapshot file and return its sections without copying
+    them.
+
+    Input:
+        path (str): name of the snapshot file
+    Output:
+        sections (dict): maps section name to a read-only memoryview
+    '''
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return read_snapshot(memoryview(mm), path)
+
+
+def read_snapshot(buf, source):
+    '''
+    Find the sections of a snapshot held in a buffer and cast them in
+    place.
+
+    Input:
+        buf (memoryview): the snapshot's bytes
+        source (str): where the buffer came from, for error messages
+    Output:
+        sections (dict): maps section name to a memoryview into buf
+    '''
+    magic, little, n = HEADER.unpack_from(buf)
+    if magic != MAGIC:
+        raise ValueError("%s is not a dictionary snapshot" % source)
+    if little != (sys.byteorder == "little"):
+        raise ValueError("%s was written on a machine with a different "
+                         "byte order" % source)
+
+    sections = {}
+    for i in range(n):
+        name, typecode, offset, nbytes = ENTRY.unpack_from(
+            buf, HEADER.size + i * ENTRY.size)
+        sections[name.rstrip(b"\0").decode()] = \
+            buf[offset:offset + nbytes].cast(typecode.decode())
+    return sections
+
+
+if __name__ == "__main__":
+    autocorrect_shell.go("english_dictionary_compact")
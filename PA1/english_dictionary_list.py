@@ -11,6 +11,7 @@
 import os
 import sys
 from sys import exit
+from itertools import islice
 import autocorrect_shell
 
 
@@ -72,6 +73,20 @@ class EnglishDictionary(object):
         '''
         return [w[len(prefix):] for w in self.words if w.startswith(prefix)]
 
+    def iter_completions(self, prefix, limit=None):
+        '''
+        Lazily generate the suffixes of the words that start with the
+        specified prefix, stopping after limit suffixes.
+
+        Inputs:
+          prefix (string): the prefix
+          limit (int or None): maximum number of suffixes to generate
+
+        Returns: generator of strings.
+        '''
+        return islice((w[len(prefix):] for w in self.words
+                       if w.startswith(prefix)), limit)
+
 
 if __name__ == "__main__":
     autocorrect_shell.go("english_dictionary_list")
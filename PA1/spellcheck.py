@@ -0,0 +1,185 @@
+# CS122: Auto-completing keyboard using Tries
+# Offline spellchecker for large text files
+#
+# Antony Awad
+#
+# Usage: python3 spellcheck.py DICTIONARY TEXT_FILE [-j JOBS]
+#
+# DICTIONARY is either a word file or a snapshot written by
+# EnglishDictionary.save. The text file is read in chunks that end on line
+# boundaries and the chunks are checked by a pool of worker processes.
+# The dictionary is loaded once, in the parent, before the pool forks, so
+# every worker queries the same read-only arrays (or, for a snapshot, the
+# same mapped pages) instead of building or unpickling its own copy. Where
+# workers are spawned rather than forked, the parent copies the arrays into
+# a shared memory segment once and every worker attaches to it.
+# Misspellings are printed in file order as FILE:LINE:COLUMN: WORD and the
+# throughput is reported on stderr.
+
+import argparse
+from collections import deque
+import multiprocessing
+import sys
+import time
+
+import english_dictionary
+import english_dictionary_compact
+
+# Bytes of text per chunk handed to a worker
+CHUNK_SIZE = 1 << 22
+
+# Dictionary used by check_chunk; inherited by forked workers
+_eng_dict = None
+
+
+def read_chunks(f, size):
+    '''
+    Read a binary file in chunks of about size bytes that end on a line
+    boundary.
+
+    Input:
+        f (file object): the file, opened in binary mode
+        size (int): number of bytes to read at a time
+    Output:
+        generator of (number of the chunk's first line, bytes)
+    '''
+    line = 1
+    rest = b""
+    while True:
+        data = f.read(size)
+        if not data:
+            break
+        data = rest + data
+        cut = data.rfind(b"\n") + 1
+        if cut == 0:
+            rest = data
+            continue
+        chunk, rest = data[:cut], data[cut:]
+        yield line, chunk
+        line += chunk.count(b"\n")
+    if rest:
+        yield line, rest
+
+
+def check_chunk(task):
+    '''
+    Spellcheck one chunk against the shared dictionary.
+
+    Input:
+        task (tuple): number of the chunk's first line, chunk bytes
+    Output:
+        misspelled (list): (line number, column, word) tuples
+        n (int): number of words checked
+    '''
+    first_line, data = task
+    lines = data.decode("utf-8", errors="replace").split("\n")
+    return english_dictionary.check_lines(_eng_dict, lines, first_line)
+
+
+def init_worker(path, shm_name=None):
+    '''
+    Pool initializer. Forked workers already have the parent's dictionary;
+    spawned workers attach to the shared memory segment holding it or,
+    failing that, load it (for a snapshot that is just a memory map).
+    '''
+    global _eng_dict
+    if _eng_dict is not None:
+        return
+    if shm_name is not None:
+        _eng_dict = english_dictionary_compact.EnglishDictionary.attach(
+            shm_name)
+    else:
+        _eng_dict = english_dictionary_compact.open_dictionary(path)
+
+
+def spellcheck(path, f, jobs, out):
+    '''
+    Check a file, writing its misspellings to out in file order.
+
+    Input:
+        path (str): name of the dictionary snapshot or word file
+        f (file object): the text file, opened in binary mode
+        jobs (int): number of worker processes; 1 checks in this process
+        out (file object): where misspellings are written
+    Output:
+        n (int): number of words checked
+        bad (int): number of misspelled words
+    '''
+    name = getattr(f, "name", "-")
+    n = 0
+    bad = 0
+
+    def emit(result):
+        misspelled, checked = result
+        for line, column, word in misspelled:
+            out.write("%s:%d:%d: %s\n" % (name, line, column, word))
+        return checked, len(misspelled)
+
+    if jobs == 1:
+        for task in read_chunks(f, CHUNK_SIZE):
+            checked, wrong = emit(check_chunk(task))
+            n += checked
+            bad += wrong
+        return n, bad
+
+    shm = None
+    if (_eng_dict is not None and hasattr(_eng_dict, "to_shared_memory")
+            and multiprocessing.get_start_method() != "fork"):
+        shm = _eng_dict.to_shared_memory()
+    try:
+        with multiprocessing.Pool(jobs, init_worker,
+                                  (path, shm and shm.name)) as pool:
+            # Keep a bounded number of chunks in flight, so memory use does
+            # not depend on the size of the file.
+            pending = deque()
+            for task in read_chunks(f, CHUNK_SIZE):
+                pending.append(pool.apply_async(check_chunk, (task,)))
+                if len(pending) >= 2 * jobs:
+                    checked, wrong = emit(pending.popleft().get())
+                    n += checked
+                    bad += wrong
+            while pending:
+                checked, wrong = emit(pending.popleft().get())
+                n += checked
+                bad += wrong
+    finally:
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+    return n, bad
+
+
+def go():
+    '''
+    Process the arguments and run the spellchecker.
+    '''
+    global _eng_dict
+
+    parser = argparse.ArgumentParser(
+        description="Report the misspelled words of a text file.")
+    parser.add_argument("dictionary",
+                        help="word file or dictionary snapshot")
+    parser.add_argument("text", help="text file to check")
+    parser.add_argument("-j", "--jobs", type=int,
+                        default=multiprocessing.cpu_count(),
+                        help="number of worker processes")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    _eng_dict = english_dictionary_compact.open_dictionary(args.dictionary)
+    loaded = time.perf_counter()
+
+    with open(args.text, "rb") as f:
+        n, bad = spellcheck(args.dictionary, f, max(args.jobs, 1),
+                            sys.stdout)
+    done = time.perf_counter()
+
+    elapsed = done - loaded
+    sys.stderr.write("loaded dictionary in %.2fs; checked %d words in %.2fs "
+                     "(%.0f words/sec), %d misspelled\n"
+                     % (loaded - start, n, elapsed,
+                        n / elapsed if elapsed > 0 else 0, bad))
+
+
+if __name__ == "__main__":
+    go()
@@ -0,0 +1,326 @@
+# CS122: Auto-completing keyboard using Tries
+# Substring index for infix queries
+#
+# Antony Awad
+#
+# The trie answers questions about prefixes only. A SubstringIndex answers
+# "which words contain this fragment?" with a suffix array over the words:
+#
+#   _text      the words in lexicographic order, each followed by "\n"
+#   _starts    _starts[i] is the offset of word i in _text (N+1 entries)
+#   _suffixes  offsets in _text of every suffix of every word, sorted by
+#              the suffix up to the end of its word
+#   _owner     _owner[j] is the number of the word that _suffixes[j] is in
+#
+# The suffixes that start with a fragment form one contiguous run of
+# _suffixes, found with two binary searches that compare at most
+# len(fragment) characters each. The words containing the fragment are
+# the owners of that run.
+#
+# A run can be most of the index for a fragment like "e", so long runs are
+# not scanned:
+#
+#   _mintree   a segment tree over _owner whose nodes hold the position of
+#              the smallest owner below them; the smallest owners of a run
+#              come out of a heap of subranges, one range-minimum query per
+#              step, for find_containing with a limit
+#   _prev      a WaveletMatrix over prev[j] + 1, where prev[j] is the
+#              position in _suffixes of the previous suffix with the same
+#              owner as _suffixes[j], or -1; the owners of _suffixes[lo:hi]
+#              are counted once each as the j in [lo, hi) with
+#              prev[j] < lo, for count_containing
+#
+# Both are built by the first query that needs them.
+
+from array import array
+from bisect import bisect_left
+import heapq
+from itertools import compress
+import sys
+
+from english_dictionary import paused_gc, read_words
+
+# Sorts after every character that can appear in a word, so that
+# fragment + END bounds the suffixes that start with fragment
+END = chr(0x10FFFF)
+
+# Runs up to this long are scanned instead of searched with _mintree or
+# counted with _prev
+SCAN_RUN = 256
+
+# Turn a bytes object of 0s and 1s into the digits of a binary number, and
+# into its complement
+BINARY_DIGITS = bytes.maketrans(b"\x00\x01", b"01")
+COMPLEMENT = bytes.maketrans(b"\x00\x01", b"\x01\x00")
+
+
+class SubstringIndex(object):
+    def __init__(self, words):
+        '''
+        Constructor
+
+        Inputs:
+            words (iterable of strings): the words, in any order;
+                duplicates are ignored
+        '''
+        words = sorted(set(words))
+        self._text = "".join(w + "\n" for w in words)
+        self._starts = array("I", [0])
+        for w in words:
+            self._starts.append(self._starts[-1] + len(w) + 1)
+
+        # Bucket the suffixes by their first letter so that only one
+        # bucket's suffix strings are alive at a time.
+        buckets = {}
+        owner_at = array("I")
+        for i, w in enumerate(words):
+            start = self._starts[i]
+            for j, letter in enumerate(w):
+                buckets.setdefault(letter, []).append(start + j)
+            owner_at.extend([i] * (len(w) + 1))
+
+        text = self._text
+        self._suffixes = array("I")
+        with paused_gc():
+            for letter in sorted(buckets):
+                bucket = buckets.pop(letter)
+                keys = [text[p:text.index("\n", p)] for p in bucket]
+                order = sorted(range(len(bucket)), key=keys.__getitem__)
+                self._suffixes.extend(map(bucket.__getitem__, order))
+        self._owner = array("I", map(owner_at.__getitem__, self._suffixes))
+        self._mintree = None
+        self._prev = None
+
+    @classmethod
+    def from_file(cls, wordfile):
+        '''
+        Build an index over a word file, read the same way as
+        EnglishDictionary reads it (frequencies are ignored).
+
+        Inputs:
+            wordfile (string): name of the file with the words
+
+        Returns: SubstringIndex
+        '''
+        with open(wordfile) as f:
+            return cls(w for w, _ in read_words(f))
+
+    def __len__(self):
+        return len(self._starts) - 1
+
+    def count_containing(self, fragment):
+        '''
+        Count the words that contain a fragment, counting a word like
+        "banana" once for "an", in O(len(fragment) * log N).
+
+        Inputs:
+            fragment (string): the fragment
+
+        Returns: int
+        '''
+        if not fragment:
+            return len(self)
+        lo, hi = self._find(fragment)
+        if hi - lo <= SCAN_RUN:
+            return len(set(self._owner[lo:hi]))
+        if self._prev is None:
+            last = array("i", [-1]) * len(self)
+            prev = array("I")
+            for j, owner in enumerate(self._owner):
+                prev.append(last[owner] + 1)
+                last[owner] = j
+            self._prev = WaveletMatrix(prev, len(self._owner))
+        return self._prev.count_less(lo, hi, lo + 1)
+
+    def count_occurrences(self, fragment):
+        '''
+        Count the places the fragment occurs in the words, in
+        O(len(fragment) * log N).
+
+        Inputs:
+            fragment (string): the fragment
+
+        Returns: int
+        '''
+        lo, hi = self._find(fragment)
+        return hi - lo
+
+    def find_containing(self, fragment, limit=None):
+        '''
+        Find the words that contain a fragment, in lexicographic order.
+        With a limit, the time depends on the limit rather than on the
+        number of occurrences: O(limit * L * log N) after the fragment is
+        found, where L bounds the occurrences of the fragment in one word.
+
+        Inputs:
+            fragment (string): the fragment
+            limit (int or None): maximum number of words to return
+
+        Returns: list of strings
+        '''
+        if not fragment:
+            ids = range(len(self) if limit is None else min(limit, len(self)))
+        else:
+            lo, hi = self._find(fragment)
+            if limit is None or hi - lo <= SCAN_RUN:
+                ids = sorted(set(self._owner[lo:hi]))[:limit]
+            else:
+                ids = self._smallest_owners(lo, hi, limit)
+        return [self.word(i) for i in ids]
+
+    def word(self, i):
+        '''
+        Returns: string, the ith word in lexicographic order
+        '''
+        return self._text[self._starts[i]:self._starts[i + 1] - 1]
+
+    def _smallest_owners(self, lo, hi, limit):
+        '''
+        Find the smallest distinct owners of _suffixes[lo:hi] without
+        looking at the whole run. Each heap entry is a subrange keyed by
+        its smallest owner; popping one reports that owner and pushes the
+        parts of the subrange on either side of it, so owners come out in
+        increasing order.
+
+        Returns: list of at most limit owners, smallest first
+        '''
+        owner = self._owner
+        argmin = self._argmin
+        found = []
+        p = argmin(lo, hi)
+        heap = [(owner[p], p, lo, hi)]
+        while heap and len(found) < limit:
+            o, p, l, r = heapq.heappop(heap)
+            if not found or found[-1] != o:
+                found.append(o)
+            if l < p:
+                q = argmin(l, p)
+                heapq.heappush(heap, (owner[q], q, l, p))
+            if p + 1 < r:
+                q = argmin(p + 1, r)
+                heapq.heappush(heap, (owner[q], q, p + 1, r))
+        return found
+
+    def _argmin(self, lo, hi):
+        '''
+        Range-minimum query on _owner, building _mintree the first time.
+
+        Returns: int, a position in [lo, hi) of the smallest owner there
+        '''
+        tree = self._mintree
+        owner = self._owner
+        n = len(owner)
+        if tree is None:
+            # Leaves n .. 2n - 1 are the positions; every inner node holds
+            # the better of its two children.
+            tree = array("I", bytes(4 * n)) + array("I", range(n))
+            for i in range(n - 1, 0, -1):
+                a = tree[2 * i]
+                b = tree[2 * i + 1]
+                tree[i] = a if owner[a] <= owner[b] else b
+            self._mintree = tree
+        best = lo
+        lo += n
+        hi += n
+        while lo < hi:
+            if lo & 1:
+                if owner[tree[lo]] < owner[best]:
+                    best = tree[lo]
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                if owner[tree[hi]] < owner[best]:
+                    best = tree[hi]
+            lo >>= 1
+            hi >>= 1
+        return best
+
+    def _find(self, fragment):
+        '''
+        Find the run of _suffixes that start with fragment.
+
+        Returns: (lo, hi), the run is _suffixes[lo:hi]
+        '''
+        if "\n" in fragment:
+            return 0, 0
+        text = self._text
+        m = len(fragment)
+
+        def key(p):
+            return text[p:p + m]
+
+        lo = bisect_left(self._suffixes, fragment, key=key)
+        hi = bisect_left(self._suffixes, fragment + END, lo, key=key)
+        return lo, hi
+
+
+class WaveletMatrix(object):
+    def __init__(self, values, largest):
+        '''
+        Constructor. Keeps, for every bit of the values from the highest
+        down, a bit vector of that bit of every value, after the values
+        have been stably sorted by the bits above it. Each bit vector is
+        packed 64 bits to a word with a running count of the ones before
+        every word, so the structure takes about 0.2 bytes per value and
+        bit.
+
+        Inputs:
+            values (array of ints): the values, between 0 and largest
+            largest (int): the largest value there can be
+        '''
+        self._n = len(values)
+        self._levels = []
+        current = array("I", values)
+        size = current.itemsize
+        for bit in reversed(range(max(1, largest.bit_length()))):
+            # Slice out the byte of every value that holds the bit, and
+            # translate it to the bit, without a loop over the values.
+            byte = bit // 8
+            if sys.byteorder == "big":
+                byte = size - 1 - byte
+            ones = current.tobytes()[byte::size].translate(
+                bytes((b >> bit % 8) & 1 for b in range(256)))
+            # Bit i of packed is bit `bit` of current[i].
+            packed = int(ones[::-1].translate(BINARY_DIGITS) or b"0", 2)
+            words = packed.to_bytes(8 * (self._n // 64 + 1), "little")
+            before = array("I", [0])
+            for w in range(len(words) // 8):
+                before.append(before[-1] + int.from_bytes(
+                    words[8 * w:8 * w + 8], "little").bit_count())
+            zeros = self._n - before[-1]
+            self._levels.append((bit, words, before, zeros))
+            # The next level sees the values with a 0 here, then those
+            # with a 1, each in their current order.
+            following = array("I", compress(current,
+                                            ones.translate(COMPLEMENT)))
+            following.extend(compress(current, ones))
+            current = following
+
+    def count_less(self, lo, hi, x):
+        '''
+        Count the values at positions lo to hi - 1 that are less than x,
+        in O(log largest).
+
+        Returns: int
+        '''
+        count = 0
+        for bit, words, before, zeros in self._levels:
+            lo_ones = self._rank(words, before, lo)
+            hi_ones = self._rank(words, before, hi)
+            if (x >> bit) & 1:
+                # The values with a 0 here are less than x; follow the 1s.
+                count += (hi - lo) - (hi_ones - lo_ones)
+                lo = zeros + lo_ones
+                hi = zeros + hi_ones
+            else:
+                lo -= lo_ones
+                hi -= hi_ones
+        return count
+
+    def _rank(self, words, before, i):
+        '''
+        Returns: int, the number of ones among the first i bits
+        '''
+        w = i >> 6
+        word = int.from_bytes(words[8 * w:8 * w + 8], "little")
+        return before[w] + (word & ((1 << (i & 63)) - 1)).bit_count()
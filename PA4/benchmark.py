@@ -0,0 +1,427 @@
+# CS122: Linking restaurant records in Zagat and Fodor's data sets
+# Benchmark on synthetic restaurant records
+#
+# Antony Awad
+#
+# Usage: python3 benchmark.py [-n SIZE ...] [-b BLOCKER] [-o OUT.json]
+#
+# zagat.csv and fodors.csv are too small to show how the linkage scales,
+# so the benchmark generates record files of its own: SIZE zagat records
+# and SIZE fodors records, a share of which are copies of zagat records
+# with typos (see generate). Some of these planted links are written to
+# known_links.csv for training, and all of them are the truth the results
+# are checked against.
+#
+# Every size is linked in a fresh Python process, running the stages of
+# record_linkage.find_matches one at a time, so that peak memory is not
+# polluted by earlier runs. For each run the harness records:
+#
+#   stages                  seconds and peak resident set size (KB) after
+#                           each stage: load, prepare (when normalizing),
+#                           train, decide, block, plan, score and result
+#   candidate_pairs         pairs chosen by the blocker
+#   comparisons             field comparisons made (see PruningStats)
+#   pairs_per_second        candidate pairs classified per second of the
+#                           score stage
+#   comparisons_per_second  field comparisons per second of the score
+#                           stage
+#   cache_hit_rate          share of comparisons saved by the caches
+#   precision, recall       of the matches, against the planted links
+#   recall_with_possible    of the matches and possible matches together
+#
+# The results are written as JSON so they can be compared across changes.
+# With -o the file is rewritten after every size, so the sizes finished
+# before a crash or an interrupt are kept.
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import blocking
+import record_linkage
+
+SIZES = [1000, 10000, 100000, 1000000]
+
+BLOCKERS = {'full': blocking.full,
+            'city': lambda: blocking.exact('City'),
+            'phonetic': lambda: blocking.phonetic('Restaurant'),
+            'qgram': lambda: blocking.qgram('Restaurant', max_block=100),
+            'sorted': lambda: blocking.sorted_neighborhood('Restaurant')}
+
+# Share of the fodors records that copy a zagat record, share of those
+# links written to known_links.csv, and mean number of typos per field of
+# a copy
+OVERLAP = 0.3
+TRAIN_SHARE = 0.1
+TYPOS = 0.5
+
+# Words that synthetic records are made of. Names start with a word
+# coined from two or three syllables, so that they differ from the first
+# letters on, as real names do.
+SYLLABLES = ['ka', 'lo', 'mi', 'ta', 'ro', 'zu', 'be', 'na', 'shi', 'vo',
+             'del', 'mar', 'qui', 'sa', 'po', 'len', 'ti', 'go', 'ra', 'fe',
+             'cha', 'no', 'vi', 'bu', 'ke', 'do', 'la', 'si', 'mo', 'pe']
+NAME_NOUNS = ['Dragon', 'Lotus', 'Olive', 'Oak', 'Pepper', 'Anchor',
+              'Lantern', 'Table', 'Kitchen', 'Spoon', 'Fig', 'Basil',
+              'Pearl', 'Tiger', 'Rose', 'Crown', 'Bridge', 'Barrel',
+              'Orchard', 'Ember', 'Salt', 'Vine', 'Moon', 'Star', 'Fox']
+NAME_KINDS = ['Cafe', 'Grill', 'Bistro', 'Trattoria', 'Diner', 'Tavern',
+              'Brasserie', 'Deli', 'Steakhouse', 'Noodle House',
+              'Ristorante', 'Cantina', 'Sushi Bar', 'Bakery', 'Chophouse']
+STREETS = ['Main', 'Pico', 'Ventura', 'Sunset', 'Broadway', 'Madison',
+           'Lexington', 'Mission', 'Market', 'Wilshire', 'Melrose',
+           'Santa Monica', 'Columbus', 'Amsterdam', 'Houston', 'Spring',
+           'Peachtree', 'Ponce de Leon', 'Fillmore', 'Valencia', 'Grand',
+           'Olympic', 'Hudson', 'Bleecker', 'Canal']
+STREET_TYPES = [('Blvd.', 'Boulevard'), ('St.', 'Street'),
+                ('Ave.', 'Avenue'), ('Rd.', 'Road'), ('Dr.', 'Drive'),
+                ('Pl.', 'Place')]
+CITIES = ['Los Angeles', 'New York', 'San Francisco', 'Atlanta',
+          'Las Vegas', 'West LA', 'Santa Monica', 'Pasadena',
+          'Beverly Hills', 'Hollywood', 'Studio City', 'Venice',
+          'Brooklyn', 'Queens', 'Oakland', 'Berkeley', 'Decatur',
+          'Marietta', 'Culver City', 'Burbank']
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+
+
+def random_records(n, rng):
+    '''
+    Make up restaurant records.
+
+    Input:
+        n (int): number of records
+        rng (RandomState)
+    Output:
+        dataframe with Restaurant, City and Address columns
+    '''
+    syllables = np.array(SYLLABLES, dtype=object)
+    coined = (syllables[rng.randint(len(SYLLABLES), size=n)] +
+              syllables[rng.randint(len(SYLLABLES), size=n)])
+    third = rng.rand(n) < 0.5
+    coined[third] += syllables[rng.randint(len(SYLLABLES),
+                                           size=np.count_nonzero(third))]
+    names = [' '.join(words) for words in zip(
+        [word.capitalize() for word in coined],
+        np.array(NAME_NOUNS)[rng.randint(len(NAME_NOUNS), size=n)],
+        np.array(NAME_KINDS)[rng.randint(len(NAME_KINDS), size=n)])]
+    street_types = rng.randint(len(STREET_TYPES), size=n)
+    addresses = ['{} {} {}'.format(number, street,
+                                   STREET_TYPES[kind][0])
+                 for number, street, kind in zip(
+                     rng.randint(1, 20000, size=n),
+                     np.array(STREETS)[rng.randint(len(STREETS), size=n)],
+                     street_types)]
+    cities = np.array(CITIES)[rng.randint(len(CITIES), size=n)]
+    return pd.DataFrame({'Restaurant': names, 'City': cities,
+                         'Address': addresses})
+
+
+def misspell(value, edits, rng):
+    '''
+    Make typos in a value: each edit deletes, inserts, replaces or swaps a
+    character at random.
+
+    Input:
+        value (str)
+        edits (int): number of typos
+        rng (RandomState)
+    Output: str
+    '''
+    chars = list(value)
+    for _ in range(edits):
+        if len(chars) < 2:
+            break
+        i = rng.randint(len(chars) - 1)
+        kind = rng.randint(4)
+        if kind == 0:
+            del chars[i]
+        elif kind == 1:
+            chars.insert(i, LETTERS[rng.randint(len(LETTERS))])
+        elif kind == 2:
+            chars[i] = LETTERS[rng.randint(len(LETTERS))]
+        else:
+            chars[i], chars[i + 1] = chars[i + 1], chars[i]
+    return ''.join(chars)
+
+
+def copy_records(records, typos, rng):
+    '''
+    Copy records the way another guide would list them: street types are
+    sometimes spelled out, and every field gets a random number of typos,
+    typos on average.
+
+    Input:
+        records (dataframe): from random_records
+        typos (float): mean number of typos per field
+        rng (RandomState)
+    Output: dataframe
+    '''
+    copies = {}
+    for column in records.columns:
+        values = records[column].to_numpy()
+        if column == 'Address':
+            spell_out = rng.rand(len(values)) < 0.5
+            values = [spelled(value) if flip else value
+                      for value, flip in zip(values, spell_out)]
+        copies[column] = [misspell(value, edits, rng) for value, edits
+                          in zip(values, rng.poisson(typos, len(values)))]
+    return pd.DataFrame(copies)
+
+
+def spelled(address):
+    '''
+    Spell out the street type at the end of an address.
+    '''
+    for short, long in STREET_TYPES:
+        if address.endswith(short):
+            return address[:-len(short)] + long
+    return address
+
+
+def generate(n, seed, directory, overlap=OVERLAP, typos=TYPOS,
+             train_share=TRAIN_SHARE):
+    '''
+    Write synthetic zagat.csv, fodors.csv and known_links.csv files.
+
+    Input:
+        n (int): number of records on each side
+        seed (int): random seed, so runs are comparable
+        directory (str): where to write the files
+        overlap (float): share of the fodors records that copy a zagat
+            record
+        typos (float): mean number of typos per field of a copy
+        train_share (float): share of the links written to
+            known_links.csv
+    Output:
+        links (array of ints): pairs of zagat and fodors positions of the
+            planted links, one row per link
+    '''
+    rng = np.random.RandomState(seed)
+    zagat = random_records(n, rng)
+    n_copies = int(n * overlap)
+    originals = rng.choice(n, n_copies, replace=False)
+    fodors = pd.concat([copy_records(zagat.iloc[originals], typos, rng),
+                        random_records(n - n_copies, rng)],
+                       ignore_index=True)
+    order = rng.permutation(n)
+    fodors = fodors.iloc[order].reset_index(drop=True)
+    # Position in the shuffled fodors file of each copy
+    positions = np.argsort(order)[:n_copies]
+    links = np.column_stack([originals, positions])
+
+    zagat.to_csv(os.path.join(directory, 'zagat.csv'), header=False)
+    fodors.to_csv(os.path.join(directory, 'fodors.csv'), header=False)
+    train = links[rng.choice(n_copies, max(int(n_copies * train_share), 1),
+                             replace=False)]
+    pd.DataFrame(train).to_csv(os.path.join(directory, 'known_links.csv'),
+                               header=False, index=False)
+    np.save(os.path.join(directory, 'links.npy'), links)
+    return links
+
+
+def peak_rss():
+    '''
+    Returns: int, peak resident set size of this process, in KB
+    '''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(directory, blocker_name, mu, lambda_, n_jobs, normalize):
+    '''
+    Link the files of a directory one stage of find_matches at a time.
+    Meant to run in a process of its own.
+
+    Input:
+        directory (str): where generate wrote the files
+        blocker_name (str): key of BLOCKERS
+        mu, lambda_ (floats): see find_matches
+        n_jobs (int): number of processes scoring pairs
+        normalize (bool): whether to normalize the records first
+    Output:
+        dict of results
+    '''
+    os.chdir(directory)
+    stages = {}
+    clock = [time.perf_counter()]
+
+    def done(stage):
+        now = time.perf_counter()
+        stages[stage] = {'seconds': now - clock[0], 'peak_rss_kb': peak_rss()}
+        clock[0] = now
+
+    zagat, fodors, matches, unmatches = record_linkage.create_dataframes()
+    z_records, f_records = zagat, fodors
+    done('load')
+    schema = record_linkage.DEFAULT_SCHEMA
+    if normalize:
+        z_records, f_records, matches, unmatches = \
+            record_linkage.prepare_records(zagat, fodors, matches, unmatches)
+        schema = record_linkage.NORMALIZED_SCHEMA
+        done('prepare')
+    match_histogram = record_linkage.pattern_histogram(matches, schema)
+    unmatch_histogram = record_linkage.pattern_histogram(unmatches, schema)
+    done('train')
+    table = record_linkage.decision_table(match_histogram, unmatch_histogram,
+                                          mu, lambda_, schema)
+    done('decide')
+    z_idx, f_idx = BLOCKERS[blocker_name]()(z_records, f_records)
+    done('block')
+    plan = record_linkage.plan_classification(
+        table, unmatch_histogram,
+        record_linkage.field_costs(z_records, f_records, z_idx, f_idx,
+                                   schema), schema)
+    done('plan')
+    caches = record_linkage.new_caches(schema)
+    pruning = record_linkage.PruningStats(schema)
+    classes, compared = record_linkage.score_pairs(
+        z_records, f_records, z_idx, f_idx, plan, n_jobs, caches, schema)
+    pruning.add(plan[0], len(z_idx), compared)
+    done('score')
+    result = record_linkage.LinkageResult(zagat, fodors, z_idx, f_idx,
+                                          classes)
+    done('result')
+
+    links = np.load('links.npy')
+    truth = links[:, 0].astype(np.int64) * len(fodors) + links[:, 1]
+    found = {}
+    for cls in (record_linkage.MATCH, record_linkage.POSSIBLE):
+        z_pos, f_pos = result.pairs(cls)
+        found[cls] = z_pos.astype(np.int64) * len(fodors) + f_pos
+    true_matches = np.count_nonzero(np.isin(found[record_linkage.MATCH],
+                                            truth))
+    true_possibles = np.count_nonzero(
+        np.isin(found[record_linkage.POSSIBLE], truth))
+
+    n_matches = result.count(record_linkage.MATCH)
+    summary = pruning.summary()
+    comparisons = sum(summary['compared'].values())
+    misses = sum(cache.stats()['misses'] for cache in caches)
+    # Guard against a score stage too quick for the clock
+    score_seconds = max(stages['score']['seconds'], 1e-9)
+    return {'records': len(zagat), 'links': len(links),
+            'training_links': len(pd.read_csv('known_links.csv',
+                                              header=None)),
+            'stages': stages, 'peak_rss_kb': peak_rss(),
+            'candidate_pairs': len(z_idx), 'comparisons': comparisons,
+            'pairs_per_second': len(z_idx) / score_seconds,
+            'comparisons_per_second': comparisons / score_seconds,
+            'field_order': summary['order'],
+            'cache_hit_rate': 1 - misses / comparisons if comparisons
+                              else 0.0,
+            'matches': n_matches,
+            'possibles': result.count(record_linkage.POSSIBLE),
+            'precision': true_matches / n_matches if n_matches else None,
+            'recall': true_matches / len(links),
+            'recall_with_possible': (true_matches + true_possibles) /
+                                    len(links)}
+
+
+def run(size, args):
+    '''
+    Generate the files for one size and run measure() on them in a fresh
+    interpreter.
+
+    Output:
+        dict of results, or of the error that stopped the run
+    '''
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        generate(size, args.seed, directory, args.overlap, args.typos)
+        generated = time.perf_counter() - start
+        cmd = [sys.executable, os.path.abspath(__file__), '--worker',
+               directory, '--blocker', args.blocker, '--mu', str(args.mu),
+               '--lambda', str(args.lambda_), '--jobs', str(args.jobs)]
+        if args.normalize:
+            cmd.append('--normalize')
+        try:
+            proc = subprocess.run(cmd, capture_output=True, text=True,
+                                  timeout=args.timeout)
+        except subprocess.TimeoutExpired:
+            return {'size': size, 'error': 'timed out after %ds'
+                                           % args.timeout}
+    if proc.returncode != 0:
+        # A worker killed by a signal, such as the OOM killer's, may have
+        # written nothing.
+        lines = proc.stderr.strip().splitlines()
+        return {'size': size,
+                'error': lines[-1] if lines
+                else 'exit status %d' % proc.returncode}
+    results = json.loads(proc.stdout)
+    results.update(size=size, generate_seconds=generated)
+    return results
+
+
+def go():
+    '''
+    Process the arguments and run the benchmark.
+    '''
+    parser = argparse.ArgumentParser(
+        description='Benchmark record linkage on synthetic records.')
+    parser.add_argument('-n', '--sizes', nargs='+', type=int, default=SIZES,
+                        help='records per side')
+    parser.add_argument('-b', '--blocker', choices=sorted(BLOCKERS),
+                        default='sorted')
+    parser.add_argument('--mu', type=float, default=0.005)
+    parser.add_argument('--lambda', dest='lambda_', type=float,
+                        default=0.005)
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='processes scoring pairs')
+    parser.add_argument('--normalize', action='store_true',
+                        help='normalize the records first')
+    parser.add_argument('--overlap', type=float, default=OVERLAP,
+                        help='share of fodors records that are copies')
+    parser.add_argument('--typos', type=float, default=TYPOS,
+                        help='mean typos per field of a copy')
+    parser.add_argument('-s', '--seed', type=int, default=122)
+    parser.add_argument('-t', '--timeout', type=int, default=3600,
+                        help='seconds allowed per run')
+    parser.add_argument('-o', '--output', help='JSON file for the results')
+    parser.add_argument('--worker', metavar='DIRECTORY',
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure(args.worker, args.blocker, args.mu,
+                                 args.lambda_, args.jobs, args.normalize)))
+        return
+
+    results = []
+    for size in args.sizes:
+        sys.stderr.write('%d records per side...\n' % size)
+        results.append(run(size, args))
+        if args.output:
+            write_report(args.output, report(args, results))
+    if not args.output:
+        print(report(args, results))
+
+
+def report(args, results):
+    '''
+    Returns: str, the JSON report of the runs so far
+    '''
+    return json.dumps({'python': sys.version.split()[0],
+                       'blocker': args.blocker, 'mu': args.mu,
+                       'lambda': args.lambda_, 'jobs': args.jobs,
+                       'normalize': args.normalize,
+                       'overlap': args.overlap, 'typos': args.typos,
+                       'seed': args.seed, 'results': results}, indent=2)
+
+
+def write_report(path, text):
+    '''
+    Replace a file with a report, writing it beside the file first so
+    that an interrupted write leaves the previous report whole.
+    '''
+    with open(path + '.tmp', 'w') as f:
+        f.write(text + '\n')
+    os.replace(path + '.tmp', path)
+
+
+if __name__ == '__main__':
+    go()
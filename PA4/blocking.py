@@ -0,0 +1,200 @@
+# CS122: Linking restaurant records in Zagat and Fodor's data sets
+# Blocking: choosing the pairs of records worth comparing
+#
+# Antony Awad
+#
+# A blocker is a function that takes the zagat and fodors dataframes and
+# returns the candidate pairs as two arrays of equal length, the row
+# positions of the zagat and of the fodors record of each pair, sorted by
+# zagat row and then by fodors row. Only candidate pairs are scored, and
+# every blocker except full() generates them block by block, so the work
+# grows with the sizes of the blocks instead of with N * M.
+#
+# Blockers take a field name such as 'City' and read the z_ and f_
+# columns of that field. When the dataframes carry the features of
+# features.add_features, blockers read their keys from the feature columns
+# instead of deriving them from the raw values; otherwise the keys are
+# derived once per distinct value.
+#
+# The candidates of exact and phonetic depend only on the two records of
+# a pair, so blocking parts of the records finds part of the candidates.
+# Those of sorted_neighborhood, and of qgram with a max_block, depend on
+# all the records. Such a blocker records its field as
+# blocker.global_field, so that a caller that reads the records in parts
+# can block that field of all of them at once (see streaming.block_files).
+
+import numpy as np
+import pandas as pd
+import jellyfish
+import features
+
+
+def full():
+    '''
+    Blocker that makes every pair of records a candidate.
+
+    Output: blocker (function)
+    '''
+    def blocker(zagat, fodors):
+        z_idx, f_idx = np.divmod(np.arange(len(zagat) * len(fodors)),
+                                 len(fodors))
+        return z_idx, f_idx
+    return blocker
+
+
+def exact(field):
+    '''
+    Blocker that pairs the records whose values of a field are equal, or
+    whose normalized values are if the dataframes have them.
+
+    Input:
+        field (str): field to block on, such as 'City'
+    Output: blocker (function)
+    '''
+    def blocker(zagat, fodors):
+        return pairs_from_keys(
+            features.column_feature(zagat, 'z_' + field, 'norm', None),
+            features.column_feature(fodors, 'f_' + field, 'norm', None))
+    return blocker
+
+
+def phonetic(field, encoder=jellyfish.soundex):
+    '''
+    Blocker that pairs the records whose values of a field start with words
+    that sound alike, so that "Cafe Bizou" and "Caffe Bizou" share a block.
+
+    Input:
+        field (str): field to block on, such as 'Restaurant'
+        encoder (function): phonetic code of a word
+    Output: blocker (function)
+    '''
+    def key(value):
+        return features.first_word_key(value, encoder)
+
+    def blocker(zagat, fodors):
+        return pairs_from_keys(
+            features.column_feature(zagat, 'z_' + field, encoder.__name__,
+                                    key),
+            features.column_feature(fodors, 'f_' + field, encoder.__name__,
+                                    key))
+    return blocker
+
+
+def qgram(field, q=3, max_block=None):
+    '''
+    Blocker that pairs the records whose values of a field share at least
+    one substring of q characters, ignoring case. A q-gram shared by many
+    records says little about whether two of them match, so q-grams with
+    more than max_block records on either side are left out.
+
+    Input:
+        field (str): field to block on, such as 'Restaurant'
+        q (int): length of the substrings
+        max_block (int or None): largest block on one side; None for no
+            limit
+    Output: blocker (function)
+    '''
+    name = '{}grams'.format(q)
+
+    def grams(value):
+        return features.qgrams(value, q)
+
+    def blocker(zagat, fodors):
+        z_grams = {}
+        for i, value in enumerate(features.column_feature(
+                zagat, 'z_' + field, name, grams)):
+            for gram in value:
+                z_grams.setdefault(gram, []).append(i)
+        f_grams = {}
+        for j, value in enumerate(features.column_feature(
+                fodors, 'f_' + field, name, grams)):
+            for gram in value:
+                f_grams.setdefault(gram, []).append(j)
+
+        blocks = []
+        for gram, z_rows in z_grams.items():
+            f_rows = f_grams.get(gram)
+            if f_rows is None:
+                continue
+            if max_block is not None and max(len(z_rows),
+                                             len(f_rows)) > max_block:
+                continue
+            blocks.append(np.add.outer(np.array(z_rows) * len(fodors),
+                                       np.array(f_rows)).ravel())
+        if not blocks:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.divmod(np.unique(np.concatenate(blocks)), len(fodors))
+    if max_block is not None:
+        blocker.global_field = field
+    return blocker
+
+
+def sorted_neighborhood(field, window=5):
+    '''
+    Blocker that sorts the records of both sides together by a field,
+    ignoring case, or by its normalized values if the dataframes have
+    them, and pairs each record with the records of the other side
+    less than window places away from it.
+
+    Input:
+        field (str): field to sort on, such as 'Restaurant'
+        window (int): size of the sliding window
+    Output: blocker (function)
+    '''
+    def key(value):
+        return str(value).lower()
+
+    def blocker(zagat, fodors):
+        keys = np.concatenate(
+            [features.column_feature(zagat, 'z_' + field, 'norm', key),
+             features.column_feature(fodors, 'f_' + field, 'norm', key)]
+        ).astype(str)
+        order = np.argsort(keys, kind='stable')
+        n = len(zagat)
+
+        pairs = []
+        for offset in range(1, window):
+            a = order[:-offset]
+            b = order[offset:]
+            z_row = np.where(a < n, a, b)
+            f_row = np.where(a < n, b, a) - n
+            other_side = (a < n) != (b < n)
+            pairs.append(z_row[other_side] * len(fodors) +
+                         f_row[other_side])
+        if not pairs:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.divmod(np.unique(np.concatenate(pairs)), len(fodors))
+    blocker.global_field = field
+    return blocker
+
+
+def pairs_from_keys(z_keys, f_keys):
+    '''
+    Pair the zagat and fodors rows that have equal blocking keys. Rows
+    whose key is missing (None, NaN or, for normalized values, '') are in
+    no block.
+
+    Input:
+        z_keys, f_keys (arrays): blocking key of each row
+    Output:
+        z_idx, f_idx (arrays of ints): row positions of the pairs, sorted
+    '''
+    codes, keys = pd.factorize(np.concatenate([z_keys, f_keys]))
+    codes[np.isin(codes, np.flatnonzero(keys == ''))] = -1
+    z_codes = codes[:len(z_keys)]
+    f_codes = codes[len(z_keys):]
+    n_keys = codes.max() + 1 if len(codes) else 0
+
+    # Group the fodors rows by key, keeping each group in row order.
+    f_order = np.argsort(f_codes, kind='stable')
+    f_sizes = np.bincount(f_codes[f_codes >= 0], minlength=n_keys)
+    f_starts = np.cumsum(f_sizes) - f_sizes + np.count_nonzero(f_codes < 0)
+
+    z_rows = np.flatnonzero(z_codes >= 0)
+    sizes = f_sizes[z_codes[z_rows]]
+    z_idx = np.repeat(z_rows, sizes)
+    # Position of each pair within its zagat row's block
+    within = np.arange(len(z_idx)) - np.repeat(np.cumsum(sizes) - sizes,
+                                               sizes)
+    f_idx = f_order[np.repeat(f_starts[z_codes[z_rows]], sizes) + within]
+    return z_idx, f_idx
@@ -0,0 +1,103 @@
+# CS122: Linking restaurant records in Zagat and Fodor's data sets
+# Memoized string comparisons
+#
+# Antony Awad
+#
+# Field values repeat a lot across candidate pairs: a handful of cities
+# cover most records, and every restaurant appears in many pairs. A
+# ComparisonCache scores each distinct pair of values in a batch once and
+# broadcasts the score back to every pair that has those values, and it
+# remembers the scores of up to maxsize value pairs across batches, least
+# recently used first out.
+
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import jellyfish
+
+# Value pairs remembered across batches, per field
+MAXSIZE = 100000
+
+
+class ComparisonCache(object):
+    def __init__(self, comparator=jellyfish.jaro_winkler, maxsize=MAXSIZE):
+        '''
+        Constructor
+
+        Inputs:
+            comparator (function): scores a pair of values
+            maxsize (int): number of value pairs remembered across batches
+        '''
+        self.comparator = comparator
+        self.maxsize = maxsize
+        self._scores = OrderedDict()
+        self.reset_stats()
+
+    def score(self, left, right):
+        '''
+        Score each pair of values of two columns.
+
+        Inputs:
+            left, right (arrays): columns of the same length
+        Output:
+            scores (array of floats)
+        '''
+        l_codes, l_values = pd.factorize(left, use_na_sentinel=False)
+        r_codes, r_values = pd.factorize(right, use_na_sentinel=False)
+        keys = l_codes.astype(np.int64) * len(r_values) + r_codes
+        distinct, inverse = np.unique(keys, return_inverse=True)
+        l_pos, r_pos = np.divmod(distinct, max(len(r_values), 1))
+
+        scores = np.empty(len(distinct), dtype=np.float64)
+        for k, key in enumerate(zip(l_values[l_pos], r_values[r_pos])):
+            score = self._scores.get(key)
+            if score is None:
+                score = self.comparator(*key)
+                self.misses += 1
+                if self.maxsize > 0:
+                    self._scores[key] = score
+                    if len(self._scores) > self.maxsize:
+                        self._scores.popitem(last=False)
+            else:
+                self._scores.move_to_end(key)
+                self.hits += 1
+            scores[k] = score
+
+        self.pairs += len(keys)
+        self.distinct += len(distinct)
+        return scores[inverse]
+
+    def stats(self):
+        '''
+        Returns: dict with the number of pairs scored, of distinct value
+            pairs among them, of those found in the cache (hits) and of
+            those compared (misses), and the share of pairs that did not
+            need a comparison (hit_rate)
+        '''
+        return {'pairs': self.pairs, 'distinct': self.distinct,
+                'hits': self.hits, 'misses': self.misses,
+                'hit_rate': 1 - self.misses / self.pairs if self.pairs
+                            else 0.0}
+
+    def reset_stats(self):
+        '''
+        Set the counts reported by stats() back to zero. The remembered
+        scores are kept.
+        '''
+        self.pairs = 0
+        self.distinct = 0
+        self.hits = 0
+        self.misses = 0
+
+    def add_stats(self, stats):
+        '''
+        Add counts reported by another cache, such as one in a worker
+        process, to this cache's counts.
+
+        Inputs:
+            stats (dict): as returned by stats()
+        '''
+        self.pairs += stats['pairs']
+        self.distinct += stats['distinct']
+        self.hits += stats['hits']
+        self.misses += stats['misses']
@@ -0,0 +1,178 @@
+# CS122: Linking restaurant records in Zagat and Fodor's data sets
+# Per-record normalization and comparison features
+#
+# Antony Awad
+#
+# Cleaning a value, or deriving a blocking key from it, inside a comparator
+# or a blocker repeats the work for every pair the record is in. Instead,
+# add_features does it once per record (in fact once per distinct value)
+# and keeps the results in extra columns next to each field's column:
+#
+#     <column>_norm      the normalized string (see normalize)
+#     <column>_soundex   Soundex code of its first word
+#     <column>_3grams    set of its substrings of 3 characters
+#     <column>_tokens    set of its words
+#
+# Blockers use these columns when a dataframe has them (see
+# blocking.phonetic, qgram and sorted_neighborhood), and a schema Field
+# compares one of them instead of the raw column when it is given the
+# feature's name (see schema.NORMALIZED_SCHEMA).
+
+import html
+import re
+import unicodedata
+import numpy as np
+import pandas as pd
+import jellyfish
+
+# Abbreviations in names and addresses, and the words they stand for
+ABBREVIATIONS = {'st': 'street', 'sts': 'streets', 'ave': 'avenue',
+                 'aves': 'avenues', 'av': 'avenue', 'blvd': 'boulevard',
+                 'rd': 'road', 'dr': 'drive', 'ln': 'lane', 'pl': 'place',
+                 'sq': 'square', 'hwy': 'highway', 'pkwy': 'parkway',
+                 'hts': 'heights', 'bldg': 'building', 'fl': 'floor',
+                 'n': 'north', 's': 'south', 'e': 'east', 'w': 'west',
+                 'bros': 'brothers'}
+
+# Length of the substrings of the q-gram feature
+Q = 3
+
+_APOSTROPHES = re.compile("['`\u2019]")
+_PUNCTUATION = re.compile(r'[^\w\s]|_')
+
+
+def normalize(value):
+    '''
+    Canonicalize a field value: decode HTML entities, drop accents, fold
+    case, spell out '&', drop apostrophes, turn other punctuation into
+    spaces and expand the abbreviations of ABBREVIATIONS, so that
+    "Caf&eacute; Bizou, 14016 Ventura Blvd." and "cafe bizou 14016 ventura
+    boulevard" are the same.
+
+    Input:
+        value (str or None): missing values normalize to ''
+    Output: str
+    '''
+    if not isinstance(value, str):
+        return ''
+    value = unicodedata.normalize('NFKD', html.unescape(value))
+    value = ''.join(c for c in value if not unicodedata.combining(c))
+    value = value.casefold().replace('&', ' and ')
+    value = _PUNCTUATION.sub(' ', _APOSTROPHES.sub('', value))
+    return ' '.join(ABBREVIATIONS.get(word, word) for word in value.split())
+
+
+def first_word_key(value, encoder=jellyfish.soundex):
+    '''
+    Phonetic code of the first word of a value, or None if it has no words.
+    '''
+    if not isinstance(value, str) or not value.split():
+        return None
+    return encoder(value.split()[0])
+
+
+def qgrams(value, q=Q):
+    '''
+    Set of the substrings of q characters of a value, ignoring case; a value
+    shorter than q is its own only q-gram.
+    '''
+    if not isinstance(value, str) or not value:
+        return frozenset()
+    value = value.lower()
+    return frozenset(value[i:i + q] for i in range(max(len(value) - q + 1,
+                                                       1)))
+
+
+def tokens(value):
+    '''
+    Set of the words of a value.
+    '''
+    if not isinstance(value, str):
+        return frozenset()
+    return frozenset(value.split())
+
+
+def jaccard(left, right):
+    '''
+    Comparator for set features: the share of the elements of either set
+    that are in both, 1 for two empty sets.
+    '''
+    if not left and not right:
+        return 1.0
+    return len(left & right) / len(left | right)
+
+
+def feature_name(column, feature):
+    '''
+    Returns: str, the name of the column holding a feature of a column
+    '''
+    return '{}_{}'.format(column, feature)
+
+
+def per_value(values, function):
+    '''
+    Apply a function to each distinct value of a column and spread the
+    results back over the column.
+
+    Input:
+        values (array or series)
+        function (function): of one value
+    Output: array of objects
+    '''
+    codes, distinct = pd.factorize(np.asarray(values, dtype=object),
+                                   use_na_sentinel=False)
+    results = np.empty(len(distinct), dtype=object)
+    results[:] = [function(value) for value in distinct]
+    return results[codes]
+
+
+def column_feature(frame, column, feature, function):
+    '''
+    Get a feature of a column: the cached feature column if the dataframe
+    has one, or else the function applied once per distinct value.
+
+    Input:
+        frame (dataframe)
+        column (str): name of the column, such as 'z_Restaurant'
+        feature (str): name of the feature, such as 'soundex'
+        function (function or None): computes the feature from a raw
+            value; None for the raw value itself
+    Output: array
+    '''
+    name = feature_name(column, feature)
+    if name in frame.columns:
+        return frame[name].to_numpy()
+    if function is None:
+        return frame[column].to_numpy()
+    return per_value(frame[column], function)
+
+
+def add_features(frame, columns=None, normalizer=normalize):
+    '''
+    Normalize the values of some columns of a dataframe and derive the
+    comparison features of each record, once per distinct value.
+
+    Input:
+        frame (dataframe)
+        columns (list of str or None): columns to add features for; None
+            for every column
+        normalizer (function): cleans a raw value into a string
+    Output:
+        dataframe with the columns of frame followed by the feature columns
+    '''
+    if columns is None:
+        columns = list(frame.columns)
+    added = {}
+    for column in columns:
+        codes, distinct = pd.factorize(frame[column].to_numpy(dtype=object),
+                                       use_na_sentinel=False)
+        text = [normalizer(value) for value in distinct]
+        for feature, values in [('norm', text),
+                                ('soundex', map(first_word_key, text)),
+                                ('{}grams'.format(Q), map(qgrams, text)),
+                                ('tokens', map(tokens, text))]:
+            results = np.empty(len(distinct), dtype=object)
+            results[:] = list(values)
+            added[feature_name(column, feature)] = results[codes]
+    return pd.concat([frame, pd.DataFrame(added, index=frame.index)],
+                     axis=1)
@@ -3,10 +3,35 @@
 # Antony Awad
 
 
+import itertools
+import multiprocessing
 import numpy as np
 import pandas as pd
 import jellyfish
-import util
+import blocking
+from comparison_cache import ComparisonCache
+import features
+from schema import DEFAULT_SCHEMA, NORMALIZED_SCHEMA
+
+# Classes of a pair of records, and the mark of a pair whose class is not
+# known yet
+POSSIBLE, MATCH, UNMATCH, UNCLASSIFIED = 0, 1, 2, -1
+UNDECIDED = -2
+
+# Candidate pairs scored per task when scoring in parallel
+CHUNK_PAIRS = 20000
+
+# Schemas with up to this many fields get every field order tried by
+# plan_classification; larger ones get a greedy order
+PLAN_SEARCH_FIELDS = 5
+
+# Columns to score, (zagat columns, fodors columns) in the order of the
+# schema's fields, one ComparisonCache per field, the classification plan
+# and the schema; set in worker processes by init_worker
+_columns = None
+_caches = None
+_plan = None
+_schema = None
 
 
 def create_dataframes():
@@ -38,7 +63,21 @@ def create_dataframes():
     return zagat, fodors, matches, unmatches
 
 
-def return_frequencies(matches, unmatches):
+def prepare_records(*frames):
+    '''
+    Preprocessing stage of find_matches. Normalizes the values of every
+    record once and adds the comparison features that comparators and
+    blockers read (see features.py), instead of cleaning values for every
+    pair compared.
+
+    Inputs:
+        frames (dataframes): such as zagat, fodors, matches and unmatches
+    Output: list of dataframes, with the feature columns added
+    '''
+    return [features.add_features(frame) for frame in frames]
+
+
+def return_frequencies(matches, unmatches, schema=DEFAULT_SCHEMA):
     '''
     Takes matches and unmatches dataframes and returns the frequency of their
     tuples being matches and unmatches.
@@ -46,13 +85,15 @@ def return_frequencies(matches, unmatches):
     Input:
         matches (dataframe)
         unmatches (dataframe)
+        schema (Schema)
     Output:
         Matches and unmatches frequency dictionaries
     '''
-    return determine_frequencies(matches), determine_frequencies(unmatches)
+    return (determine_frequencies(matches, schema),
+            determine_frequencies(unmatches, schema))
 
 
-def determine_frequencies(values):
+def determine_frequencies(values, schema=DEFAULT_SCHEMA):
     '''
     Helper function for return_frequencies. Takes a dataframe, applies the
     jaro_winkler distance formula, turns these into values of low, medium,
@@ -60,38 +101,401 @@ def determine_frequencies(values):
 
     Inputs:
         values (dataframe)
+        schema (Schema): with another schema, the keys are the tuples of
+            category names of its fields
     Outputs:
         frequencies (dict): maps triples to relative frequencies
     '''
-    frequencies = init_frequencies()
+    return dict(zip(pattern_names(schema),
+                    pattern_histogram(values, schema).tolist()))
+
+
+def pattern_names(schema=DEFAULT_SCHEMA):
+    '''
+    Lists the category names of every pattern code, in the order of the
+    codes. For DEFAULT_SCHEMA these are the 27 triples such as
+    ('low', 'high', 'medium'), with the first field varying slowest.
 
-    for _, row in values.iterrows():
-        name_cat = util.get_jw_category(jellyfish.jaro_winkler(
-            row.z_Restaurant, row.f_Restaurant))
-        city_cat = util.get_jw_category(jellyfish.jaro_winkler(
-            row.z_City, row.f_City))
-        address_cat = util.get_jw_category(jellyfish.jaro_winkler(
-            row.z_Address, row.f_Address))
-        frequencies[tuple([name_cat, city_cat, address_cat])] += 1
-    total = sum(frequencies.values())
-    return {k:float(v/total) for (k, v) in frequencies.items()}
+    Inputs:
+        schema (Schema)
+    Output: list of tuples of str
+    '''
+    return [schema.names(code) for code in range(schema.n_patterns)]
 
 
-def init_frequencies():
+def pattern_histogram(values, schema=DEFAULT_SCHEMA):
     '''
-    Helper function for match_estimates. Initializes frequency dictionary
-    with one of each kind of tuple (27 total).
-    
-    Output: frequency_count (dict)
+    Counts how often each pattern code occurs among the rows of a dataframe
+    of record pairs.
+
+    Inputs:
+        values (dataframe): has the columns of the schema's fields
+        schema (Schema)
+    Output:
+        histogram (array of floats): relative frequency of every code
+    '''
+    counts = np.bincount(pattern_codes(values, schema),
+                         minlength=schema.n_patterns)
+    return counts / counts.sum()
+
+
+def pattern_codes(values, schema=DEFAULT_SCHEMA):
+    '''
+    Helper function for pattern_histogram. Scores every row of a dataframe
+    of record pairs one field at a time and packs the categories of a row
+    into one code (see schema.py); with the default schema the code is
+    name * 9 + city * 3 + address, where each category is coded 0 for
+    low, 1 for medium and 2 for high by schema.Field.categorize.
+
+    Inputs:
+        values (dataframe): has the columns of the schema's fields
+        schema (Schema)
+    Output:
+        codes (array of ints): one code per row
+    '''
+    return schema.pack(
+        field.categorize(compare_columns(values[field.z_column].to_numpy(),
+                                         values[field.f_column].to_numpy(),
+                                         field.comparator))
+        for field in schema.fields)
+
+
+def pair_codes(zagat, fodors, z_idx, f_idx, n_jobs=1, caches=None,
+               schema=DEFAULT_SCHEMA):
+    '''
+    Like pattern_codes, for pairs of rows of the zagat and fodors
+    dataframes. Every field of every pair is scored; see score_pairs.
+
+    Inputs:
+        zagat, fodors (dataframes)
+        z_idx, f_idx (arrays of ints): row positions of the pairs
+        n_jobs (int): number of worker processes; 1 scores in this process
+        caches (list or None): a ComparisonCache per field of the schema;
+            None uses new ones
+        schema (Schema)
+    Output:
+        codes (array of ints): one code per pair
+    '''
+    codes, _ = score_pairs(zagat, fodors, z_idx, f_idx, None, n_jobs, caches,
+                           schema)
+    return codes
+
+
+def score_pairs(zagat, fodors, z_idx, f_idx, plan, n_jobs=1, caches=None,
+                schema=DEFAULT_SCHEMA):
+    '''
+    Helper function for create_match_df. Scores pairs of rows of the zagat
+    and fodors dataframes, either fully into codes or, following a plan
+    from plan_classification, only as far as it takes to fix each pair's
+    class. Scores go through one ComparisonCache per field, so repeated
+    pairs of values are compared once.
+
+    With more than one job the pairs are cut into chunks of CHUNK_PAIRS and
+    scored by a pool of processes. Each worker is sent the string columns
+    of the schema's fields once, and then only the row positions of each
+    chunk; the chunks' results are put back together in order, so they do
+    not depend on n_jobs. Every worker keeps caches of its own and reports
+    their counts back to caches.
+
+    Inputs:
+        zagat, fodors (dataframes)
+        z_idx, f_idx (arrays of ints): row positions of the pairs
+        plan (tuple or None): see plan_classification; None scores every
+            field of every pair
+        n_jobs (int): number of worker processes; 1 scores in this process
+        caches (list or None): a ComparisonCache per field of the schema;
+            None uses new ones
+        schema (Schema)
+    Output:
+        results (array of ints): one code per pair, or one class per pair
+            if there is a plan
+        compared (array of ints): number of pairs compared on each field
+    '''
+    if caches is None:
+        caches = new_caches(schema)
+    columns = ([zagat[field.z_column].to_numpy() for field in schema.fields],
+               [fodors[field.f_column].to_numpy() for field in schema.fields])
+    if n_jobs == 1 or len(z_idx) <= CHUNK_PAIRS:
+        return score_chunk((z_idx, f_idx), columns, caches, plan, schema)
+
+    n_chunks = -(-len(z_idx) // CHUNK_PAIRS)
+    tasks = zip(np.array_split(z_idx, n_chunks),
+                np.array_split(f_idx, n_chunks))
+    maxsizes = [cache.maxsize for cache in caches]
+    with multiprocessing.Pool(n_jobs, init_worker,
+                              (columns, maxsizes, plan, schema)) as pool:
+        results = pool.map(work_chunk, tasks)
+    for _, _, stats in results:
+        for cache, field_stats in zip(caches, stats):
+            cache.add_stats(field_stats)
+    return (np.concatenate([r for r, _, _ in results]),
+            sum(compared for _, compared, _ in results))
+
+
+def new_caches(schema=DEFAULT_SCHEMA):
     '''
-    frequency_count = {}
-    lst = ['low', 'medium', 'high']
-    for i in lst:
-        for j in lst:
-            for k in lst:
-                combo = tuple([i, j, k])
-                frequency_count[combo] = 0
-    return frequency_count
+    Make a ComparisonCache for every field of a schema, using the field's
+    comparator, for passing to find_matches and reading the hit rates
+    afterwards.
+
+    Output: list of ComparisonCache objects
+    '''
+    return [ComparisonCache(field.comparator) for field in schema.fields]
+
+
+def init_worker(columns, maxsizes, plan, schema):
+    '''
+    Pool initializer for score_pairs. Keeps the columns to score, the plan
+    and the schema, and makes the worker's caches.
+    '''
+    global _columns, _caches, _plan, _schema
+    _columns = columns
+    _caches = [ComparisonCache(field.comparator, maxsize)
+               for field, maxsize in zip(schema.fields, maxsizes)]
+    _plan = plan
+    _schema = schema
+
+
+def work_chunk(task):
+    '''
+    Score one chunk of pairs in a worker process.
+
+    Inputs:
+        task (tuple): z_idx, f_idx (arrays of ints), row positions of the
+            pairs
+    Output:
+        results, compared: see score_chunk
+        stats (list of dicts): cache counts for this chunk, per field
+    '''
+    results, compared = score_chunk(task, _columns, _caches, _plan, _schema)
+    stats = [cache.stats() for cache in _caches]
+    for cache in _caches:
+        cache.reset_stats()
+    return results, compared, stats
+
+
+def score_chunk(task, columns, caches, plan, schema=DEFAULT_SCHEMA):
+    '''
+    Helper function for score_pairs. Scores one chunk of pairs.
+
+    Without a plan every field of every pair is scored. With one, fields
+    are scored in the plan's order and a pair drops out as soon as the
+    categories it has so far leave only one possible class.
+
+    Inputs:
+        task (tuple): z_idx, f_idx (arrays of ints), row positions of the
+            pairs
+        columns (tuple): zagat columns, fodors columns (lists of arrays) in
+            the order of the schema's fields
+        caches (list): a ComparisonCache per field
+        plan (tuple or None): see plan_classification
+        schema (Schema)
+    Output:
+        results (array of ints): codes, or classes if there is a plan
+        compared (array of ints): number of pairs compared on each field
+    '''
+    z_idx, f_idx = task
+    z_columns, f_columns = columns
+    compared = np.zeros(len(schema), dtype=np.int64)
+    if plan is None:
+        compared[:] = len(z_idx)
+        return schema.pack(
+            field.categorize(cache.score(z_col[z_idx], f_col[f_idx]))
+            for field, z_col, f_col, cache in zip(schema.fields, z_columns,
+                                                  f_columns, caches)), \
+            compared
+
+    order, tables = plan
+    classes = np.full(len(z_idx), UNDECIDED)
+    live = np.arange(len(z_idx))
+    partial = np.zeros(len(z_idx), dtype=np.int64)
+    for field, table in zip(order, tables):
+        if len(live) == 0:
+            break
+        scores = caches[field].score(z_columns[field][z_idx[live]],
+                                     f_columns[field][f_idx[live]])
+        compared[field] = len(live)
+        partial = (partial * schema.radices[field] +
+                   schema.fields[field].categorize(scores))
+        decided = table[partial]
+        done = decided != UNDECIDED
+        classes[live[done]] = decided[done]
+        live = live[~done]
+        partial = partial[~done]
+    return classes, compared
+
+
+def plan_classification(table, frequencies, costs, schema=DEFAULT_SCHEMA):
+    '''
+    Helper function for create_match_df. Chooses the order in which to
+    score the fields so that the expected cost of classifying a pair is
+    lowest when pairs stop being scored as soon as their class is fixed.
+
+    Every order is tried for up to PLAN_SEARCH_FIELDS fields. Beyond that
+    the F! orders are too many, and the fields are taken greedily: next is
+    the field with the lowest cost per share of the pairs it would decide,
+    or, if none would decide any, the cheapest.
+
+    Inputs:
+        table (array of ints): class of every code, from decision_table
+        frequencies (array of floats): expected share of the pairs with
+            each code
+        costs (list of floats): expected cost of scoring each field of the
+            schema for every pair
+        schema (Schema)
+    Output: plan (tuple)
+        order (tuple of ints): fields of the schema, in the order to score
+            them
+        tables (list of arrays): for each number m of fields scored, the
+            class fixed by the categories of the first m fields of order,
+            packed like a code, or UNDECIDED
+    '''
+    frequencies = np.asarray(frequencies, dtype=np.float64)
+    digits = schema.digits(np.arange(len(table)))
+    start = (np.zeros(len(table), dtype=np.int64), 1, None,
+             np.ones(len(table), dtype=bool))
+
+    if len(schema) > PLAN_SEARCH_FIELDS:
+        order = []
+        tables = []
+        step = start
+        remaining = list(range(len(schema)))
+        while remaining:
+            share = frequencies[step[3]].sum()
+            best = None
+            for field in remaining:
+                candidate = refine_plan(table, step, digits[field],
+                                        schema.radices[field])
+                decided = share - frequencies[candidate[3]].sum()
+                key = ((0, costs[field] / decided) if decided > 0
+                       else (1, costs[field]))
+                if best is None or key < best[0]:
+                    best = (key, field, candidate)
+            _, field, step = best
+            remaining.remove(field)
+            order.append(field)
+            tables.append(step[2])
+        return tuple(order), tables
+
+    best = None
+    for order in itertools.permutations(range(len(schema))):
+        tables = []
+        step = start
+        cost = 0.0
+        for field in order:
+            cost += costs[field] * frequencies[step[3]].sum()
+            step = refine_plan(table, step, digits[field],
+                               schema.radices[field])
+            tables.append(step[2])
+        if best is None or cost < best[0]:
+            best = (cost, order, tables)
+    return best[1], best[2]
+
+
+def refine_plan(table, step, digits, radix):
+    '''
+    Helper function for plan_classification. Adds one field to the fields
+    scored so far.
+
+    Inputs:
+        table (array of ints): class of every code
+        step (tuple): partial, size, partial table and undecided for the
+            fields so far; partial packs their categories for every code,
+            size is the number of such packings and undecided marks the
+            codes whose class they do not fix
+        digits (array of ints): category of the field for every code
+        radix (int): number of categories of the field
+    Output: step (tuple) for the fields so far and this one
+    '''
+    partial, size, _, _ = step
+    partial = partial * radix + digits
+    size *= radix
+    low = np.full(size, len(table))
+    high = np.full(size, -len(table))
+    np.minimum.at(low, partial, table)
+    np.maximum.at(high, partial, table)
+    partial_table = np.where(low == high, low, UNDECIDED)
+    return partial, size, partial_table, partial_table[partial] == UNDECIDED
+
+
+def field_costs(zagat, fodors, z_idx, f_idx, schema=DEFAULT_SCHEMA):
+    '''
+    Helper function for create_match_df. Estimates what scoring each field
+    of the schema for every pair would cost: the number of distinct pairs
+    of values (all that a ComparisonCache compares) times their mean
+    length.
+
+    Inputs:
+        zagat, fodors (dataframes)
+        z_idx, f_idx (arrays of ints): row positions of the pairs
+        schema (Schema)
+    Output: costs (list of floats)
+    '''
+    costs = []
+    for field in schema.fields:
+        z_col = zagat[field.z_column]
+        f_col = fodors[field.f_column]
+        z_codes, z_values = pd.factorize(z_col, use_na_sentinel=False)
+        f_codes, f_values = pd.factorize(f_col, use_na_sentinel=False)
+        distinct = len(np.unique(z_codes[z_idx].astype(np.int64) *
+                                 len(f_values) + f_codes[f_idx]))
+        length = (z_col.astype(str).str.len().mean() +
+                  f_col.astype(str).str.len().mean())
+        costs.append(distinct * length)
+    return costs
+
+
+def compare_columns(left, right, comparator=jellyfish.jaro_winkler):
+    '''
+    Compute the score of each pair of values of two columns, by default
+    their Jaro-Winkler score.
+
+    Inputs:
+        left, right (arrays of strings): columns of the same length
+        comparator (function): scores a pair of values
+    Output:
+        scores (array of floats)
+    '''
+    return np.fromiter((comparator(a, b) for a, b in zip(left, right)),
+                       dtype=np.float64, count=len(left))
+
+
+def decision_table(match_histogram, unmatch_histogram, mu, lambda_,
+                   schema=DEFAULT_SCHEMA):
+    '''
+    Gives the class of every pattern code from the match and unmatch
+    histograms. This is sorter, create_sets and class_table on flat
+    arrays: codes never seen are possible, codes seen only among matches
+    rank first, in code order, and the others follow by decreasing ratio
+    of match to unmatch frequency, ties going to the code whose category
+    names sort last. The longest run from the top whose unmatch
+    frequencies add up to at most mu are matches, the longest run from the
+    bottom whose match frequencies add up to at most lambda_ are unmatches
+    (unless they are already matches), and the rest are possible.
+
+    Input:
+        match_histogram, unmatch_histogram (arrays of floats): relative
+            frequency of every code, from pattern_histogram
+        mu (float): maximum false positive rate
+        lambda_ (float): maximum false negative rate
+        schema (Schema)
+    Output:
+        table (array of ints): POSSIBLE, MATCH or UNMATCH for every code
+    '''
+    m = np.asarray(match_histogram, dtype=np.float64)
+    u = np.asarray(unmatch_histogram, dtype=np.float64)
+    codes = np.arange(schema.n_patterns)
+    certain = codes[(u == 0) & (m != 0)]
+    rated = codes[u != 0]
+    ratios = m[rated] / u[rated]
+    rated = rated[np.lexsort((-schema.name_rank()[rated], -ratios))]
+    ranked = np.concatenate([certain, rated])
+
+    table = np.full(schema.n_patterns, POSSIBLE)
+    bottom = ranked[::-1]
+    table[bottom[np.cumsum(m[bottom]) <= lambda_]] = UNMATCH
+    table[ranked[np.cumsum(u[ranked]) <= mu]] = MATCH
+    return table
 
 
 def sorter(match_frequencies, unmatch_frequencies, mu, lambda_):
@@ -161,43 +565,183 @@ def create_sets(ranked_lst, possible_tuples, match_frequencies,
 
 
 def create_match_df(zagat, fodors, possible_tuples, match_tuples, 
-                    unmatch_tuples, block_on_city):
+                    unmatch_tuples, block_on_city, blocker=None, n_jobs=1,
+                    caches=None, frequencies=None, pruning=None,
+                    schema=DEFAULT_SCHEMA):
     '''
-    Goes through every combination of rows between the zagat and fodors 
-    dataframes and determines whether the rows are matches, unmatches, or 
-    possible matches and constructs correspondent dataframes.
+    Scores the candidate pairs of rows of the zagat and fodors dataframes
+    chosen by a blocker and determines whether they are matches, unmatches,
+    or possible matches.
+
+    Often the categories of one or two fields already fix a pair's class,
+    so the fields are scored in the order that plan_classification expects
+    to be cheapest and each pair stops being scored once its class is
+    fixed.
 
     Input:
         zagat, fodors (dataframes)
         possible_tuples, match_tuples, unmatch_tuples (sets): contain
-            correspondent tuples that add up to 27 total
-        block_on_city (bool): whether or not to block on city
+            correspondent tuples that add up to 27 total, or to
+            schema.n_patterns tuples of category names for another schema
+        block_on_city (bool): whether or not to block on city; ignored if
+            a blocker is given
+        blocker (function or None): see blocking.py
+        n_jobs (int): number of processes scoring pairs
+        caches (list or None): see score_pairs
+        frequencies (dict or None): maps triples to their expected share
+            of the candidate pairs, to plan the order of the fields; None
+            takes every triple to be equally likely
+        pruning (PruningStats or None): records the comparisons skipped
+        schema (Schema): the fields compared, as in find_matches; the
+            tuples and frequencies are keyed by pattern_names(schema)
     Output:
-        (matches_df, possible_matches_df, unmatches_df) 3-tuple of dataframe
-            objects
-    '''
-    master_dict = {'possible_lst_z':[], 'possible_lst_f':[], 'match_lst_z':[],
-        'match_lst_f':[], 'unmatch_lst_z':[], 'unmatch_lst_f':[]}
-    for i, z_row in zagat.iterrows():
-        for j, f_row in fodors.iterrows():
-            if block_on_city is True:
-                if z_row.z_City == f_row.f_City:
-                    master_dict = create_index_lists(z_row, f_row, 
-                        possible_tuples, match_tuples, unmatch_tuples, 
-                        master_dict, i, j)
-            else:
-                master_dict = create_index_lists(z_row, f_row, 
-                    possible_tuples, match_tuples, unmatch_tuples, 
-                    master_dict, i, j)
+        LinkageResult, which unpacks into matches, possible matches and
+            unmatches
+    '''
+    table = class_table(possible_tuples, match_tuples, unmatch_tuples,
+                        schema)
+    z_idx, f_idx, classes = classify_candidates(zagat, fodors, table,
+        choose_blocker(block_on_city, blocker), n_jobs, caches,
+        expected_codes(frequencies, schema), pruning, schema)
+
+    return LinkageResult(zagat, fodors, z_idx, f_idx, classes)
+
+
+class LinkageResult(object):
+    def __init__(self, zagat, fodors, z_idx, f_idx, classes):
+        '''
+        Constructor. Keeps the classified pairs as arrays of row positions
+        and class codes; the six-column dataframe of a class is only built
+        when it is asked for, and then kept.
+
+        A LinkageResult unpacks, like the 3-tuple find_matches used to
+        return, into the dataframes of the matches, the possible matches
+        and the unmatches. Callers that only need the counts or the row
+        positions should use count and pairs, which build no dataframes.
+
+        Inputs:
+            zagat, fodors (dataframes)
+            z_idx, f_idx (arrays of ints): row positions of the pairs
+            classes (array of ints): class of every pair
+        '''
+        self.zagat = zagat
+        self.fodors = fodors
+        # Nearly every pair can be a candidate, so the positions take the
+        # smallest type that holds a row position of either dataframe.
+        position = np.min_scalar_type(max(len(zagat), len(fodors), 1) - 1)
+        self.z_idx = np.asarray(z_idx, dtype=position)
+        self.f_idx = np.asarray(f_idx, dtype=position)
+        self.classes = np.asarray(classes, dtype=np.int8)
+        self._counts = np.bincount(self.classes[self.classes >= 0],
+                                   minlength=3)
+        self._frames = {}
+
+    def count(self, cls):
+        '''
+        Returns: int, number of pairs of a class (MATCH, POSSIBLE or
+            UNMATCH)
+        '''
+        return int(self._counts[cls])
+
+    def pairs(self, cls):
+        '''
+        Returns: z_idx, f_idx (arrays of ints), row positions of the pairs
+            of a class, in the smallest unsigned type that holds them; cast
+            them before computing with them
+        '''
+        mask = self.classes == cls
+        return self.z_idx[mask], self.f_idx[mask]
+
+    def frame(self, cls):
+        '''
+        Build the dataframe of the pairs of a class, as final_constructor
+        does, the first time it is asked for.
+
+        Returns: dataframe with 6 columns
+        '''
+        if cls not in self._frames:
+            z_idx, f_idx = self.pairs(cls)
+            self._frames[cls] = final_constructor(self.zagat, self.fodors,
+                                                  z_idx, f_idx)
+        return self._frames[cls]
+
+    def __iter__(self):
+        for cls in (MATCH, POSSIBLE, UNMATCH):
+            yield self.frame(cls)
+
+    def __getitem__(self, i):
+        return self.frame((MATCH, POSSIBLE, UNMATCH)[i])
+
+    def __len__(self):
+        return 3
+
+
+def choose_blocker(block_on_city, blocker):
+    '''
+    Helper function for create_match_df and find_matches. Picks the blocker
+    to use: the one given, or else blocking on city or no blocking.
+
+    Input:
+        block_on_city (bool): whether or not to block on city
+        blocker (function or None): see blocking.py
+    Output: blocker (function)
+    '''
+    if blocker is not None:
+        return blocker
+    if block_on_city:
+        return blocking.exact('City')
+    return blocking.full()
 
-    matches_df = final_constructor(zagat, fodors,
-        master_dict['match_lst_z'], master_dict['match_lst_f'])
-    possible_matches_df = final_constructor(zagat, fodors,
-        master_dict['possible_lst_z'], master_dict['possible_lst_f'])
-    unmatches_df = final_constructor(zagat, fodors,
-        master_dict['unmatch_lst_z'], master_dict['unmatch_lst_f'])
 
-    return (matches_df, possible_matches_df, unmatches_df)
+def classify_candidates(zagat, fodors, table, blocker, n_jobs=1, caches=None,
+                        expected=None, pruning=None, schema=DEFAULT_SCHEMA):
+    '''
+    Finds the candidate pairs of rows of the zagat and fodors dataframes
+    and classifies them, scoring each pair only until its class is fixed.
+
+    Input:
+        zagat, fodors (dataframes)
+        table (array of ints): class of every code, from decision_table
+        blocker (function): see blocking.py
+        n_jobs (int): number of processes scoring pairs
+        caches (list or None): see score_pairs
+        expected (array of floats or None): expected share of the pairs
+            with each code, such as the unmatch histogram; None takes every
+            code to be equally likely
+        pruning (PruningStats or None): records the comparisons skipped
+        schema (Schema)
+    Output:
+        z_idx, f_idx (arrays of ints): row positions of the pairs
+        classes (array of ints): class of every pair
+    '''
+    z_idx, f_idx = blocker(zagat, fodors)
+    if expected is None:
+        expected = np.ones(schema.n_patterns)
+    plan = plan_classification(table, expected,
+                               field_costs(zagat, fodors, z_idx, f_idx,
+                                           schema), schema)
+    classes, compared = score_pairs(zagat, fodors, z_idx, f_idx, plan,
+                                    n_jobs, caches, schema)
+    if pruning is not None:
+        pruning.add(plan[0], len(z_idx), compared)
+    return z_idx, f_idx, classes
+
+
+def expected_codes(frequencies, schema=DEFAULT_SCHEMA):
+    '''
+    Helper function for create_match_df. Turns a frequency dictionary into
+    the expected share of the pairs with each code.
+
+    Input:
+        frequencies (dict or None): maps triples to relative frequencies;
+            None takes every triple to be equally likely
+        schema (Schema)
+    Output: array of floats
+    '''
+    if frequencies is None:
+        return np.ones(schema.n_patterns)
+    return np.array([frequencies[triple]
+                     for triple in pattern_names(schema)])
 
 
 def final_constructor(zagat, fodors, indexZ, indexF):
@@ -214,42 +758,95 @@ def final_constructor(zagat, fodors, indexZ, indexF):
         fodors.iloc[indexF].reset_index(drop = True)], axis = 1)
 
 
-def create_index_lists(z_row, f_row, possible_tuples, match_tuples, 
-                        unmatch_tuples, master_dict, i, j):
+def classify_codes(codes, possible_tuples, match_tuples, unmatch_tuples,
+                   schema=DEFAULT_SCHEMA):
     '''
-    Helper function for create_match_df. Takes rows of zagat and fodors and 
-    assigns their respective indices to lists dependent on their match 
-    relation.
+    Looks up the class of every pair from its code.
 
     Input:
-        z_row, f_row (row objects)
-        possible_tuples, match_tuples, unmatch_tuples (lst): lists of 
+        codes (array of ints): codes from pair_codes
+        possible_tuples, match_tuples, unmatch_tuples (sets): contain
             correspondent tuples
-        i, j (int): indices
+        schema (Schema): the schema the codes were packed with
     Output:
-        master_dict (dict): maps list name to list of indices
-    '''
-    name_cat = util.get_jw_category(jellyfish.jaro_winkler(
-        z_row.z_Restaurant, f_row.f_Restaurant))
-    city_cat = util.get_jw_category(jellyfish.jaro_winkler(z_row.z_City, 
-        f_row.f_City))
-    address_cat = util.get_jw_category(jellyfish.jaro_winkler(z_row.z_Address, 
-        f_row.f_Address))
-    current_triple = tuple([name_cat, city_cat, address_cat])
-    if current_triple in possible_tuples:
-        master_dict['possible_lst_z'].append(i)
-        master_dict['possible_lst_f'].append(j)
-    elif current_triple in match_tuples:
-        master_dict['match_lst_z'].append(i)
-        master_dict['match_lst_f'].append(j)
-    elif current_triple in unmatch_tuples:
-        master_dict['unmatch_lst_z'].append(i)
-        master_dict['unmatch_lst_f'].append(j)
-
-    return master_dict
-    
+        classes (array of ints): POSSIBLE, MATCH, UNMATCH or UNCLASSIFIED
+            for every pair
+    '''
+    return class_table(possible_tuples, match_tuples, unmatch_tuples,
+                       schema)[codes]
 
-def find_matches(mu, lambda_, block_on_city=False):
+
+def class_table(possible_tuples, match_tuples, unmatch_tuples,
+                schema=DEFAULT_SCHEMA):
+    '''
+    Helper function for create_match_df. Gives the class of every code. A
+    triple in more than one set counts as possible before match, and as
+    match before unmatch.
+
+    Input:
+        possible_tuples, match_tuples, unmatch_tuples (sets): contain
+            correspondent tuples
+        schema (Schema)
+    Output:
+        table (array of ints): POSSIBLE, MATCH, UNMATCH or UNCLASSIFIED
+            for every code
+    '''
+    table = np.full(schema.n_patterns, UNCLASSIFIED)
+    for code, triple in enumerate(pattern_names(schema)):
+        if triple in possible_tuples:
+            table[code] = POSSIBLE
+        elif triple in match_tuples:
+            table[code] = MATCH
+        elif triple in unmatch_tuples:
+            table[code] = UNMATCH
+    return table
+
+
+class PruningStats(object):
+    def __init__(self, schema=DEFAULT_SCHEMA):
+        '''
+        Constructor. Counts the comparisons made and skipped on each field
+        by create_match_df.
+
+        Inputs:
+            schema (Schema): the schema the pairs are scored with
+        '''
+        self.names = [field.name for field in schema.fields]
+        self.order = None
+        self.pairs = 0
+        self.compared = np.zeros(len(schema), dtype=np.int64)
+
+    def add(self, order, pairs, compared):
+        '''
+        Record one classification run.
+
+        Inputs:
+            order (tuple of ints): the order the fields were scored in
+            pairs (int): number of candidate pairs
+            compared (array of ints): pairs compared on each field
+        '''
+        self.order = order
+        self.pairs += pairs
+        self.compared += compared
+
+    def summary(self):
+        '''
+        Returns: dict with the field order, the number of pairs, the number
+            of comparisons made and skipped per field, and the share of all
+            comparisons that were skipped
+        '''
+        names = self.names
+        skipped = self.pairs - self.compared
+        total = self.pairs * len(names)
+        return {'order': [names[field] for field in self.order or ()],
+                'pairs': self.pairs,
+                'compared': dict(zip(names, self.compared.tolist())),
+                'skipped': dict(zip(names, skipped.tolist())),
+                'skip_rate': float(skipped.sum()) / total if total else 0.0}
+
+
+def find_matches(mu, lambda_, block_on_city=False, blocker=None, n_jobs=1,
+                 caches=None, pruning=None, schema=None, normalize=False):
     '''
     Master function that creates initial dataframes, analyzes them for matches,
     possible matches, and unmatches, then creates three final dataframes.
@@ -258,24 +855,44 @@ def find_matches(mu, lambda_, block_on_city=False):
         mu (float): maximum false positive rate
         lambda (float): maximum false negative rate
         block_on_city (bool): indicate whether to block on city or not
+        blocker (function or None): blocker from blocking.py; overrides
+            block_on_city
+        n_jobs (int): number of processes scoring pairs
+        caches (list or None): a ComparisonCache per field (see
+            new_caches), whose stats() show how many comparisons were saved
+        pruning (PruningStats or None): counts the comparisons skipped
+            because a pair's class was already fixed
+        schema (Schema or None): the fields compared and how their scores
+            are binned, see schema.py; None for DEFAULT_SCHEMA, or
+            NORMALIZED_SCHEMA if normalizing
+        normalize (bool): whether to normalize the records first, so that
+            blockers and the schema can use their features
     Output:
-        3-tuple containing dataframes matches, possible matches, and unmatches
+        LinkageResult, which unpacks into matches, possible matches, and
+            unmatches
     '''
     zagat, fodors, matches, unmatches = create_dataframes()
-    match_frequencies, unmatch_frequencies = return_frequencies(matches, 
-        unmatches)
-    possible_tuples, match_tuples, unmatch_tuples = sorter(match_frequencies,
-        unmatch_frequencies, mu, lambda_)
-
-    return create_match_df(zagat, fodors, possible_tuples, match_tuples, 
-                            unmatch_tuples, block_on_city)
+    z_records, f_records = zagat, fodors
+    if normalize:
+        z_records, f_records, matches, unmatches = prepare_records(
+            zagat, fodors, matches, unmatches)
+    if schema is None:
+        schema = NORMALIZED_SCHEMA if normalize else DEFAULT_SCHEMA
+    match_histogram = pattern_histogram(matches, schema)
+    unmatch_histogram = pattern_histogram(unmatches, schema)
+    table = decision_table(match_histogram, unmatch_histogram, mu, lambda_,
+                           schema)
+    z_idx, f_idx, classes = classify_candidates(z_records, f_records, table,
+        choose_blocker(block_on_city, blocker), n_jobs, caches,
+        unmatch_histogram, pruning, schema)
+
+    return LinkageResult(zagat, fodors, z_idx, f_idx, classes)
                                                         ###GRADER COMMENT:
                                                         #Great job on this!
 if __name__ == '__main__':
-    matches, possibles, unmatches = \
-        find_matches(0.005, 0.005, block_on_city=True)
+    result = find_matches(0.005, 0.005, block_on_city=True)
 
     print("Found {} matches, {} possible matches, and {} "
-          "unmatches with no blocking.".format(matches.shape[0],
-                                               possibles.shape[0],
-                                               unmatches.shape[0]))
+          "unmatches with no blocking.".format(result.count(MATCH),
+                                               result.count(POSSIBLE),
+                                               result.count(UNMATCH)))
@@ -0,0 +1,151 @@
+# CS122: Linking restaurant records in Zagat and Fodor's data sets
+# Comparison schema
+#
+# Antony Awad
+#
+# A Schema lists the fields compared for every pair of records. Each Field
+# has its own comparator and thresholds; the thresholds bin a score into
+# one of len(thresholds) + 1 categories, coded 0, 1, ... from least to most
+# similar, exactly as util.get_jw_category does with THRESH1 and THRESH2.
+# The categories of all the fields of a pair are packed into one integer
+# pattern code, in mixed radix with the first field most significant, so
+# histograms and decision tables are flat arrays indexed by pattern code.
+
+import numpy as np
+import jellyfish
+import features
+import util
+
+
+class Field(object):
+    def __init__(self, name, comparator=jellyfish.jaro_winkler,
+                 thresholds=(util.THRESH1, util.THRESH2), categories=None,
+                 z_column=None, f_column=None, feature=None):
+        '''
+        Constructor
+
+        Inputs:
+            name (str): name of the field, such as 'City'
+            comparator (function): scores a pair of values between 0 and 1;
+                must be a module-level function when scoring in parallel
+            thresholds (sequence of floats): increasing category boundaries
+            categories (list of str or None): names of the categories, from
+                least to most similar; defaults to util.CATEGORIES for two
+                thresholds and to the category codes otherwise
+            z_column, f_column (str or None): columns compared; default to
+                'z_' and 'f_' followed by the name
+            feature (str or None): feature of the columns to compare
+                instead of their raw values, such as 'norm' or 'tokens';
+                see features.py
+        '''
+        self.name = name
+        self.comparator = comparator
+        self.thresholds = np.asarray(thresholds, dtype=np.float64)
+        if categories is None:
+            if len(self.thresholds) == len(util.CATEGORIES) - 1:
+                categories = util.CATEGORIES
+            else:
+                categories = [str(i) for i in range(len(thresholds) + 1)]
+        if len(categories) != len(self.thresholds) + 1:
+            raise ValueError("field {} has {} thresholds but {} categories"
+                             .format(name, len(self.thresholds),
+                                     len(categories)))
+        self.categories = list(categories)
+        self.z_column = z_column or 'z_' + name
+        self.f_column = f_column or 'f_' + name
+        if feature is not None:
+            self.z_column = features.feature_name(self.z_column, feature)
+            self.f_column = features.feature_name(self.f_column, feature)
+
+    @property
+    def n_categories(self):
+        return len(self.categories)
+
+    def categorize(self, scores):
+        '''
+        Bin scores into category codes.
+
+        Inputs:
+            scores (array of floats)
+
+        Returns: array of ints
+        '''
+        return np.searchsorted(self.thresholds, scores, side='right')
+
+
+class Schema(object):
+    def __init__(self, fields):
+        '''
+        Constructor
+
+        Inputs:
+            fields (list of Field objects): the fields, most significant
+                first
+        '''
+        self.fields = list(fields)
+        self.radices = [field.n_categories for field in self.fields]
+        self.n_patterns = int(np.prod(self.radices))
+        self._places = [int(np.prod(self.radices[k + 1:]))
+                        for k in range(len(self.fields))]
+        self._name_rank = None
+
+    def __len__(self):
+        return len(self.fields)
+
+    def pack(self, categories):
+        '''
+        Pack the categories of each field into pattern codes.
+
+        Inputs:
+            categories (iterable of arrays of ints): categories of each
+                field, in the order of the fields
+
+        Returns: array of ints
+        '''
+        codes = None
+        for radix, field_categories in zip(self.radices, categories):
+            if codes is None:
+                codes = np.asarray(field_categories, dtype=np.int64)
+            else:
+                codes = codes * radix + field_categories
+        return codes
+
+    def digits(self, codes):
+        '''
+        Unpack pattern codes into the category of each field.
+
+        Inputs:
+            codes (array of ints)
+
+        Returns: list of arrays of ints, one per field
+        '''
+        return [codes // place % radix
+                for place, radix in zip(self._places, self.radices)]
+
+    def names(self, code):
+        '''
+        Returns: tuple of str, the category names of a pattern code
+        '''
+        return tuple(field.categories[int(digit)] for field, digit
+                     in zip(self.fields, self.digits(code)))
+
+    def name_rank(self):
+        '''
+        Returns: array of ints, the rank of every pattern code when the
+            codes are sorted by their category names
+        '''
+        if self._name_rank is None:
+            order = sorted(range(self.n_patterns), key=self.names)
+            self._name_rank = np.empty(self.n_patterns, dtype=np.int64)
+            self._name_rank[order] = np.arange(self.n_patterns)
+        return self._name_rank
+
+
+# The three fields of the restaurant data, binned by util's thresholds
+DEFAULT_SCHEMA = Schema([Field('Restaurant'), Field('City'),
+                         Field('Address')])
+
+# The same fields, comparing the values normalized by features.add_features
+NORMALIZED_SCHEMA = Schema([Field('Restaurant', feature='norm'),
+                            Field('City', feature='norm'),
+                            Field('Address', feature='norm')])
@@ -0,0 +1,443 @@
+# CS122: Linking restaurant records in Zagat and Fodor's data sets
+# Streaming linkage for record sets that do not fit in memory
+#
+# Antony Awad
+#
+# find_matches reads both record files whole and returns every classified
+# pair in memory. stream_matches does the same linkage a chunk of records
+# at a time: the training pairs are gathered in two passes that keep only
+# the rows they need, and the zagat and fodors files are then read in
+# chunks and joined chunk by chunk, the candidate pairs of each pair of
+# chunks being classified and written straight to a sink.
+#
+# Some blockers pick their candidates from the whole record set: the
+# windows of blocking.sorted_neighborhood slide over all the records
+# sorted together, and blocking.qgram's max_block counts every record in
+# a block. Blocking each pair of chunks on its own would change their
+# candidates with the chunk size, so such a blocker (one with a
+# global_field, see blocking.py) is run once over that field of every
+# record, and only the pairs of chunks holding candidates are classified;
+# the fodors file is still read once per zagat chunk that holds
+# candidates. Other blockers, such as blocking.exact, phonetic and full,
+# find the same candidates chunk by chunk and are run on every pair of
+# chunks, which takes work in proportion to the number of pairs of chunks
+# as well as to the number of candidates.
+#
+# Memory use depends on the chunk size and the size of the training
+# sample, not on the size of the files, except with a global_field
+# blocker: it keeps that field of every record and the candidate pairs,
+# which for sorted_neighborhood are fewer than window times the number of
+# records.
+#
+# A sink is a CsvSink or a SqliteSink (see open_sink). Each row written is
+# one classified pair: its class, the ids of its zagat and fodors records
+# and the six fields of the two records.
+
+import sqlite3
+import numpy as np
+import pandas as pd
+import blocking
+import record_linkage
+
+# Records per chunk of each file
+CHUNK_ROWS = 5000
+
+# Rows a SqliteSink buffers before writing and committing them
+SQLITE_BATCH_ROWS = 50000
+
+# Number of sampled unmatched pairs and the seeds used to sample them, as
+# in record_linkage.create_dataframes
+SAMPLE_SIZE = 1000
+ZAGAT_SEED = 1234
+FODORS_SEED = 5678
+
+CLASS_NAMES = {record_linkage.MATCH: 'match',
+               record_linkage.POSSIBLE: 'possible',
+               record_linkage.UNMATCH: 'unmatch'}
+
+
+class CsvSink(object):
+    def __init__(self, path):
+        '''
+        Constructor. Truncates the file.
+
+        Inputs:
+            path (str): name of the CSV file to write
+        '''
+        self._f = open(path, 'w', newline='')
+        self._header = True
+
+    def write(self, pairs):
+        '''
+        Append classified pairs.
+
+        Inputs:
+            pairs (dataframe): one row per pair
+        '''
+        pairs.to_csv(self._f, header=self._header, index=False)
+        self._header = False
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SqliteSink(object):
+    def __init__(self, path, table='pairs', batch_rows=SQLITE_BATCH_ROWS):
+        '''
+        Constructor. Replaces the table if it exists.
+
+        Inputs:
+            path (str): name of the SQLite database
+            table (str): name of the table to write
+            batch_rows (int): rows written and committed together
+        '''
+        self._conn = sqlite3.connect(path)
+        self._table = table
+        self._batch_rows = batch_rows
+        self._batch = []
+        self._buffered = 0
+        self._conn.execute('DROP TABLE IF EXISTS "%s"' % table)
+        self._conn.commit()
+
+    def write(self, pairs):
+        '''
+        Append classified pairs. They are buffered and committed a batch
+        at a time, since every commit waits for the disk.
+
+        Inputs:
+            pairs (dataframe): one row per pair
+        '''
+        self._batch.append(pairs)
+        self._buffered += len(pairs)
+        if self._buffered >= self._batch_rows:
+            self.flush()
+
+    def flush(self):
+        '''
+        Write and commit the buffered pairs, in one transaction.
+        '''
+        if self._batch:
+            pd.concat(self._batch).to_sql(self._table, self._conn,
+                                          if_exists='append', index=False)
+        self._batch = []
+        self._buffered = 0
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_sink(path):
+    '''
+    Open the sink for a file name: SQLite for names ending in .db, .sqlite
+    or .sqlite3, CSV otherwise.
+
+    Input:
+        path (str): name of the output file
+    Output: CsvSink or SqliteSink
+    '''
+    if path.endswith(('.db', '.sqlite', '.sqlite3')):
+        return SqliteSink(path)
+    return CsvSink(path)
+
+
+def read_chunks(path, prefix, chunk_rows):
+    '''
+    Read a record file a chunk at a time.
+
+    Input:
+        path (str): name of the CSV file
+        prefix (str): 'z_' or 'f_', for the column names
+        chunk_rows (int): records per chunk
+    Output:
+        generator of (position of the chunk's first record, dataframe)
+    '''
+    names = [prefix + 'Restaurant', prefix + 'City', prefix + 'Address']
+    start = 0
+    with pd.read_csv(path, names=names, index_col=0,
+                     chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            yield start, chunk
+            start += len(chunk)
+
+
+def select_rows(path, prefix, positions, chunk_rows):
+    '''
+    Gather the records at some positions of a file, reading it in chunks.
+
+    Input:
+        path (str): name of the CSV file
+        prefix (str): 'z_' or 'f_'
+        positions (array of ints): positions wanted, in any order and with
+            repeats
+        chunk_rows (int): records per chunk
+    Output:
+        dataframe with the records in the order of positions
+    '''
+    wanted = np.unique(positions)
+    kept = []
+    for start, chunk in read_chunks(path, prefix, chunk_rows):
+        inside = wanted[(wanted >= start) & (wanted < start + len(chunk))]
+        kept.append(chunk.iloc[inside - start])
+    rows = pd.concat(kept)
+    return rows.iloc[np.searchsorted(wanted, positions)]
+
+
+def count_rows(path, chunk_rows):
+    '''
+    Count the records of a file, reading it in chunks.
+    '''
+    return sum(len(chunk) for _, chunk in read_chunks(path, '', chunk_rows))
+
+
+def training_pairs(zagat_path, fodors_path, links_path,
+                   chunk_rows=CHUNK_ROWS):
+    '''
+    Build the matched and unmatched training pairs of
+    record_linkage.create_dataframes without loading the record files:
+    the known links and the same random sample of records are gathered
+    with chunked reads.
+
+    Input:
+        zagat_path, fodors_path, links_path (str): names of the CSV files
+        chunk_rows (int): records per chunk
+    Output:
+        matches, unmatches (dataframes)
+    '''
+    links = pd.read_csv(links_path, names=['Zagat_ID', 'Fodors_ID'])
+
+    # DataFrame.sample(n, replace=True, random_state=seed) draws
+    # RandomState(seed).choice(len, n); drawing the same positions here
+    # keeps the training data identical to create_dataframes.
+    z_sample = np.random.RandomState(ZAGAT_SEED).choice(
+        count_rows(zagat_path, chunk_rows), SAMPLE_SIZE, replace=True)
+    f_sample = np.random.RandomState(FODORS_SEED).choice(
+        count_rows(fodors_path, chunk_rows), SAMPLE_SIZE, replace=True)
+
+    z_rows = select_rows(zagat_path, 'z_', np.concatenate(
+        [links['Zagat_ID'].to_numpy(), z_sample]), chunk_rows)
+    f_rows = select_rows(fodors_path, 'f_', np.concatenate(
+        [links['Fodors_ID'].to_numpy(), f_sample]), chunk_rows)
+    n = len(links)
+    matches = pd.concat([z_rows.iloc[:n].reset_index(drop=True),
+                         f_rows.iloc[:n].reset_index(drop=True)], axis=1)
+    unmatches = pd.concat([z_rows.iloc[n:].reset_index(drop=True),
+                           f_rows.iloc[n:].reset_index(drop=True)], axis=1)
+    return matches, unmatches
+
+
+def block_files(blocker, zagat_path, fodors_path, chunk_rows=CHUNK_ROWS,
+                normalize=False):
+    '''
+    Find the candidate pairs of two record files with a blocker that reads
+    one field, holding only that field of the records in memory.
+
+    Input:
+        blocker (function): a blocker with a global_field; see
+            blocking.py
+        zagat_path, fodors_path (str): names of the CSV files
+        chunk_rows (int): records per chunk
+        normalize (bool): whether the blocker sees normalized records
+    Output:
+        z_idx, f_idx (arrays of ints): positions of the pairs in the
+            files, sorted
+    '''
+    sides = []
+    for path, prefix in [(zagat_path, 'z_'), (fodors_path, 'f_')]:
+        column = prefix + blocker.global_field
+        chunks = []
+        for _, chunk in read_chunks(path, prefix, chunk_rows):
+            chunk = chunk[[column]]
+            if normalize:
+                chunk, = record_linkage.prepare_records(chunk)
+            chunks.append(chunk)
+        sides.append(pd.concat(chunks))
+    return blocker(*sides)
+
+
+def stream_matches(mu, lambda_, sink, zagat_path='zagat.csv',
+                   fodors_path='fodors.csv', links_path='known_links.csv',
+                   blocker=None, chunk_rows=CHUNK_ROWS,
+                   classes=(record_linkage.MATCH, record_linkage.POSSIBLE,
+                            record_linkage.UNMATCH),
+                   caches=None, pruning=None, schema=None, normalize=False):
+    '''
+    Link two record files chunk by chunk, writing the classified pairs to
+    a sink as they are found.
+
+    A blocker with a global_field is run once over that field of both
+    files and the pairs of chunks holding its candidates are classified;
+    any other blocker is run on every pair of chunks (see the comment at
+    the top of this file). The order in which the fields are scored is
+    planned once, from the first pair of chunks with candidates. Pairs are
+    written grouped by zagat chunk and fodors chunk; within a pair of
+    chunks they are in zagat and then fodors order.
+
+    Input:
+        mu (float): maximum false positive rate
+        lambda_ (float): maximum false negative rate
+        sink (CsvSink or SqliteSink): where the pairs go
+        zagat_path, fodors_path, links_path (str): names of the CSV files
+        blocker (function or None): see blocking.py; None compares every
+            pair
+        chunk_rows (int): records per chunk
+        classes (tuple): classes of the pairs to write
+        caches (list or None): see record_linkage.score_pairs; kept across
+            chunks
+        pruning (PruningStats or None): records the comparisons skipped
+        schema (Schema or None): see record_linkage.find_matches
+        normalize (bool): whether to normalize the records of each chunk
+            as it is read; see record_linkage.prepare_records
+    Output:
+        counts (dict): number of pairs of each class, by class name
+    '''
+    matches, unmatches = training_pairs(zagat_path, fodors_path, links_path,
+                                        chunk_rows)
+    if normalize:
+        matches, unmatches = record_linkage.prepare_records(matches,
+                                                            unmatches)
+    if schema is None:
+        schema = (record_linkage.NORMALIZED_SCHEMA if normalize
+                  else record_linkage.DEFAULT_SCHEMA)
+    match_histogram = record_linkage.pattern_histogram(matches, schema)
+    unmatch_histogram = record_linkage.pattern_histogram(unmatches, schema)
+    table = record_linkage.decision_table(match_histogram, unmatch_histogram,
+                                          mu, lambda_, schema)
+    if blocker is None:
+        blocker = blocking.full()
+    if caches is None:
+        caches = record_linkage.new_caches(schema)
+
+    candidates = None
+    if hasattr(blocker, 'global_field'):
+        candidates = block_files(blocker, zagat_path, fodors_path,
+                                 chunk_rows, normalize)
+
+    counts = dict.fromkeys(CLASS_NAMES.values(), 0)
+    wanted = np.array(classes)
+    plan = None
+    for zagat, z_records, fodors, f_records, chunk_blocker in chunk_pairs(
+            zagat_path, fodors_path, chunk_rows, blocker, candidates,
+            normalize):
+        z_idx, f_idx = chunk_blocker(z_records, f_records)
+        if len(z_idx) == 0:
+            continue
+        if plan is None:
+            # The order of the fields is planned once, from the first pair
+            # of chunks with candidates, as classify_candidates would.
+            plan = record_linkage.plan_classification(
+                table, unmatch_histogram,
+                record_linkage.field_costs(z_records, f_records, z_idx,
+                                           f_idx, schema), schema)
+        pair_classes, compared = record_linkage.score_pairs(
+            z_records, f_records, z_idx, f_idx, plan, 1, caches, schema)
+        if pruning is not None:
+            pruning.add(plan[0], len(z_idx), compared)
+        for code, name in CLASS_NAMES.items():
+            counts[name] += int(np.count_nonzero(pair_classes == code))
+
+        keep = np.isin(pair_classes, wanted)
+        if np.any(keep):
+            sink.write(pair_rows(zagat, fodors, z_idx[keep], f_idx[keep],
+                                 pair_classes[keep]))
+    return counts
+
+
+def chunk_pairs(zagat_path, fodors_path, chunk_rows, blocker,
+                candidates=None, normalize=False):
+    '''
+    Helper function for stream_matches. Reads the pairs of chunks to
+    classify.
+
+    Input:
+        zagat_path, fodors_path (str): names of the CSV files
+        chunk_rows (int): records per chunk
+        blocker (function): see blocking.py
+        candidates (tuple or None): positions in the files of the
+            candidate pairs, sorted, from block_files; None to run the
+            blocker on every pair of chunks
+        normalize (bool): whether to prepare the records of each chunk;
+            see record_linkage.prepare_records
+    Output:
+        generator of (zagat chunk, its records, fodors chunk, its records,
+            blocker for that pair of chunks); the records are the chunks
+            themselves unless normalize is set
+    '''
+    for z_start, zagat in read_chunks(zagat_path, 'z_', chunk_rows):
+        if candidates is not None:
+            # The candidates of this zagat chunk, at fodors positions
+            lo, hi = np.searchsorted(candidates[0],
+                                     [z_start, z_start + len(zagat)])
+            if lo == hi:
+                continue
+            z_idx = candidates[0][lo:hi] - z_start
+            f_idx = candidates[1][lo:hi]
+        z_records = zagat
+        if normalize:
+            z_records, = record_linkage.prepare_records(zagat)
+
+        for f_start, fodors in read_chunks(fodors_path, 'f_', chunk_rows):
+            chunk_blocker = blocker
+            if candidates is not None:
+                if f_start > f_idx.max():
+                    break
+                inside = ((f_idx >= f_start) &
+                          (f_idx < f_start + len(fodors)))
+                if not np.any(inside):
+                    continue
+                chunk_blocker = fixed_pairs(z_idx[inside],
+                                            f_idx[inside] - f_start)
+            f_records = fodors
+            if normalize:
+                f_records, = record_linkage.prepare_records(fodors)
+            yield zagat, z_records, fodors, f_records, chunk_blocker
+
+
+def fixed_pairs(z_idx, f_idx):
+    '''
+    Helper function for chunk_pairs. Blocker that returns pairs found
+    beforehand.
+
+    Output: blocker (function)
+    '''
+    def blocker(zagat, fodors):
+        return z_idx, f_idx
+    return blocker
+
+
+def pair_rows(zagat, fodors, z_idx, f_idx, pair_classes):
+    '''
+    Helper function for stream_matches. Lays out classified pairs for a
+    sink.
+
+    Input:
+        zagat, fodors (dataframes): the chunks the pairs come from
+        z_idx, f_idx (arrays of ints): row positions of the pairs
+        pair_classes (array of ints): class of every pair
+    Output:
+        dataframe
+    '''
+    z_rows = zagat.iloc[z_idx]
+    f_rows = fodors.iloc[f_idx]
+    names = np.array([CLASS_NAMES[code] for code in sorted(CLASS_NAMES)])
+    columns = {'class': names[np.searchsorted(sorted(CLASS_NAMES),
+                                              pair_classes)],
+               'zagat_id': z_rows.index.to_numpy(),
+               'fodors_id': f_rows.index.to_numpy()}
+    for column in zagat.columns:
+        columns[column] = z_rows[column].to_numpy()
+    for column in fodors.columns:
+        columns[column] = f_rows[column].to_numpy()
+    return pd.DataFrame(columns)
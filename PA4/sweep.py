@@ -0,0 +1,145 @@
+# CS122: Linking restaurant records in Zagat and Fodor's data sets
+# Threshold sweeps
+#
+# Antony Awad
+#
+# A pair's class depends on mu and lambda_ only through the decision table,
+# which maps its pattern code to a class. Scoring the pairs is what costs,
+# so a ThresholdSweep scores every candidate pair once, keeps its pattern
+# code and the match and unmatch histograms, and then answers for any
+# (mu, lambda_) by building the decision table, one entry per code (27
+# with the default schema; see record_linkage.decision_table), and adding
+# up the pairs of each code.
+#
+# Usage:
+#
+#     sweep = prepare_sweep(block_on_city=True)
+#     sweep.sweep([0.001, 0.005, 0.01], [0.001, 0.005, 0.01])
+#     matches, possibles, unmatches = sweep.result(0.005, 0.005)
+
+import numpy as np
+import pandas as pd
+import record_linkage
+from record_linkage import MATCH, POSSIBLE, UNMATCH
+
+
+class ThresholdSweep(object):
+    def __init__(self, zagat, fodors, z_idx, f_idx, codes, match_histogram,
+                 unmatch_histogram, schema=record_linkage.DEFAULT_SCHEMA):
+        '''
+        Constructor
+
+        Inputs:
+            zagat, fodors (dataframes)
+            z_idx, f_idx (arrays of ints): row positions of the candidate
+                pairs
+            codes (array of ints): pattern code of every pair, from
+                record_linkage.pair_codes
+            match_histogram, unmatch_histogram (arrays of floats): from
+                record_linkage.pattern_histogram
+            schema (Schema): the schema the codes were packed with
+        '''
+        self.zagat = zagat
+        self.fodors = fodors
+        self.z_idx = z_idx
+        self.f_idx = f_idx
+        self.codes = np.asarray(
+            codes, dtype=np.min_scalar_type(schema.n_patterns - 1))
+        self.match_histogram = match_histogram
+        self.unmatch_histogram = unmatch_histogram
+        self.schema = schema
+        self.code_counts = np.bincount(self.codes,
+                                       minlength=schema.n_patterns)
+
+    def table(self, mu, lambda_):
+        '''
+        Returns: array of ints, the class of every pattern code
+        '''
+        return record_linkage.decision_table(self.match_histogram,
+                                             self.unmatch_histogram, mu,
+                                             lambda_, self.schema)
+
+    def counts(self, mu, lambda_):
+        '''
+        Count the pairs of each class for one setting, without looking at
+        the pairs.
+
+        Input:
+            mu (float): maximum false positive rate
+            lambda_ (float): maximum false negative rate
+        Output:
+            counts (dict): number of pairs of each class, by class name
+        '''
+        per_class = np.bincount(self.table(mu, lambda_),
+                                weights=self.code_counts, minlength=3)
+        return {'match': int(per_class[MATCH]),
+                'possible': int(per_class[POSSIBLE]),
+                'unmatch': int(per_class[UNMATCH])}
+
+    def sweep(self, mus, lambdas):
+        '''
+        Count the pairs of each class for every combination of a mu and a
+        lambda_.
+
+        Input:
+            mus, lambdas (iterables of floats)
+        Output:
+            dataframe with columns mu, lambda, match, possible and unmatch,
+                one row per combination, mu varying slowest
+        '''
+        lambdas = list(lambdas)
+        rows = []
+        for mu in mus:
+            for lambda_ in lambdas:
+                row = {'mu': mu, 'lambda': lambda_}
+                row.update(self.counts(mu, lambda_))
+                rows.append(row)
+        return pd.DataFrame(rows, columns=['mu', 'lambda', 'match',
+                                           'possible', 'unmatch'])
+
+    def result(self, mu, lambda_):
+        '''
+        Classify the pairs for one setting, as find_matches would.
+
+        Input:
+            mu (float): maximum false positive rate
+            lambda_ (float): maximum false negative rate
+        Output:
+            LinkageResult, which unpacks into matches, possible matches and
+                unmatches
+        '''
+        return record_linkage.LinkageResult(
+            self.zagat, self.fodors, self.z_idx, self.f_idx,
+            self.table(mu, lambda_)[self.codes])
+
+
+def prepare_sweep(block_on_city=False, blocker=None, n_jobs=1, caches=None,
+                  schema=None, normalize=False):
+    '''
+    Run the part of find_matches that does not depend on mu and lambda_:
+    load the data, estimate the histograms, and score every field of every
+    candidate pair. Pairs are not pruned as in find_matches, since which
+    fields fix a pair's class depends on the setting.
+
+    Input:
+        block_on_city, blocker, n_jobs, caches, schema, normalize: see
+            record_linkage.find_matches
+    Output: ThresholdSweep
+    '''
+    zagat, fodors, matches, unmatches = record_linkage.create_dataframes()
+    z_records, f_records = zagat, fodors
+    if normalize:
+        z_records, f_records, matches, unmatches = \
+            record_linkage.prepare_records(zagat, fodors, matches, unmatches)
+    if schema is None:
+        schema = (record_linkage.NORMALIZED_SCHEMA if normalize
+                  else record_linkage.DEFAULT_SCHEMA)
+    match_histogram = record_linkage.pattern_histogram(matches, schema)
+    unmatch_histogram = record_linkage.pattern_histogram(unmatches, schema)
+
+    blocker = record_linkage.choose_blocker(block_on_city, blocker)
+    z_idx, f_idx = blocker(z_records, f_records)
+    codes = record_linkage.pair_codes(z_records, f_records, z_idx, f_idx,
+                                      n_jobs, caches, schema)
+    return ThresholdSweep(zagat, fodors, z_idx, f_idx, codes,
+                          match_histogram, unmatch_histogram, schema)
@@ -3,6 +3,10 @@
 THRESH1 = 0.8
 THRESH2 = 1.0
 
+# Category names, from least to most similar; schema.Field codes them 0, 1
+# and 2
+CATEGORIES = ["low", "medium", "high"]
+
 def get_jw_category(j):
     '''
     Convert a Jaro-Winkler score into a categorical: low, medium, high
@@ -19,3 +23,4 @@ def get_jw_category(j):
     if j < THRESH2:
         return "medium"
     return "high"
+